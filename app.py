@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import chess
 import chess.engine
@@ -6,100 +6,280 @@ import os
 import sys
 import subprocess
 import logging
+import json
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from sessions import SessionStore
+from engine_pool import EnginePool, EngineUnavailable
+from move_cache import MoveCache
+from book import open_book, book_move
 
 app = Flask(__name__)
 CORS(app)
 
 logging.basicConfig(level=logging.INFO)
 
-board = chess.Board()
+DEFAULT_GAME_ID = "default"  # Used by clients that do not send a game_id
+
+sessions = SessionStore(
+    max_sessions=int(os.environ.get("MAX_SESSIONS", 10000)),
+    idle_timeout=float(os.environ.get("SESSION_IDLE_TIMEOUT", 3600)),
+)
 current_dir = os.path.dirname(os.path.abspath(__file__))
-model_path = os.path.join(current_dir, "model.pb.gz")
 
-if not os.path.exists(model_path):
-    raise FileNotFoundError(f"Model file not found: {model_path}")
+# "lc0" searches with model.pb.gz; "torch" answers in-process with a ChessCNN checkpoint
+BACKEND = os.environ.get("CHESS_BACKEND", "lc0")
 
-lc0_command = ["lc0", f"--weights={model_path}"]
+if BACKEND == "torch":
+    from torch_backend import TorchBackend
+    engine_pool = TorchBackend(
+        os.environ.get("TORCH_MODEL_PATH", os.path.join(current_dir, "best_chess_model.pth")),
+        size=int(os.environ.get("ENGINE_POOL_SIZE", 1)),
+        num_threads=int(os.environ.get("TORCH_NUM_THREADS", 0)) or None,
+        # Concurrent requests are batched into one forward pass; 1 disables batching
+        max_batch_size=int(os.environ.get("TORCH_MAX_BATCH", 32)),
+        max_wait=float(os.environ.get("TORCH_MAX_WAIT_MS", 2)) / 1000,
+    )
+else:
+    model_path = os.path.join(current_dir, "model.pb.gz")
 
-def initialize_engine():
-    try:
-        return chess.engine.SimpleEngine.popen_uci(lc0_command)
-    except Exception as e:
-        logging.error(f"Error initializing Lc0 engine: {e}")
-        return None
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Model file not found: {model_path}")
+
+    lc0_command = ["lc0", f"--weights={model_path}"]
+
+    # Each engine is a separate lc0 process; size the pool to the available cores
+    engine_pool = EnginePool(
+        lc0_command,
+        size=int(os.environ.get("ENGINE_POOL_SIZE", 1)),
+        health_check_interval=float(os.environ.get("ENGINE_HEALTH_CHECK_INTERVAL", 30)),
+    )
+
+# Set MOVE_CACHE_DB to a file path to share cached moves between gunicorn workers
+move_cache = MoveCache(
+    max_entries=int(os.environ.get("MOVE_CACHE_SIZE", 100000)),
+    shared_path=os.environ.get("MOVE_CACHE_DB"),
+)
+
+# Built with `python book.py` from lc0's replies, so by default only the lc0 backend uses it
+default_book_path = os.path.join(current_dir, "book.bin") if BACKEND == "lc0" else None
+opening_book = open_book(os.environ.get("BOOK_PATH", default_book_path))
+
+AI_MOVE_LIMIT = chess.engine.Limit(time=0.1)
+MAX_BATCH_TIME = float(os.environ.get("MAX_BATCH_TIME", 1.0))  # Per-position cap for /moves
+# How long /move waits for a free engine before answering 503; only that game's requests wait with it
+MOVE_CHECKOUT_TIMEOUT = float(os.environ.get("MOVE_CHECKOUT_TIMEOUT", 10.0))
+# An application/json batch is parsed whole; larger batches should be sent as NDJSON
+MAX_JSON_BATCH_BYTES = int(os.environ.get("MAX_JSON_BATCH_BYTES", 1 << 20))
+
+# Searches for /moves; a few extra threads keep every engine busy between positions
+batch_executor = ThreadPoolExecutor(max_workers=engine_pool.size * 2)
 
-engine = initialize_engine()
+def lookup_session(game_id):
+    if not game_id or game_id == DEFAULT_GAME_ID:
+        return sessions.get_or_create(DEFAULT_GAME_ID)
+    return sessions.get(game_id)
+
+@app.route('/new', methods=['POST'])
+def new_game():
+    session = sessions.create()
+    return jsonify({"game_id": session.game_id, "fen": session.fen})
 
 @app.route('/move', methods=['POST'])
 def make_move():
-    global engine, board
     data = request.json
     move_uci = data.get('move')
     if not move_uci:
         return jsonify({"error": "No move provided"}), 400
 
+    session = lookup_session(data.get('game_id'))
+    if session is None:
+        return jsonify({"error": "Unknown game"}), 404
+
     try:
         move = chess.Move.from_uci(move_uci)
-        if move in board.legal_moves:
-            board.push(move)
-            
-            if board.is_game_over():
-                result = get_game_result(board)
-                return jsonify({
-                    "player_move": move_uci,
-                    "ai_move": None,  # Explicitly state no AI move
-                    "game_over": True,
-                    "result": result
-                })
-            
-            # Attempt to get AI move, reinitialize engine if it fails
-            for _ in range(3):  # Try up to 3 times
-                try:
-                    ai_move = get_ai_move(engine, board)
-                    board.push(ai_move)
-                    if board.is_game_over():
-                        result = get_game_result(board)
-                        return jsonify({
-                            "player_move": move_uci,
-                            "ai_move": ai_move.uci(),
-                            "game_over": True,
-                            "result": result
-                        })
-                    return jsonify({"player_move": move_uci, "ai_move": ai_move.uci()})
-                except chess.engine.EngineTerminatedError:
-                    logging.warning("Engine terminated. Attempting to restart...")
-                    if engine:
-                        engine.quit()
-                    engine = initialize_engine()
-                    if not engine:
-                        return jsonify({"error": "Failed to restart chess engine"}), 500
-            
-            return jsonify({"error": "Failed to get AI move after multiple attempts"}), 500
-        else:
-            return jsonify({"error": "Illegal move"}), 400
     except ValueError:
         return jsonify({"error": "Invalid move format"}), 400
 
+    with session.lock:
+        board = session.board
+        if move not in board.legal_moves:
+            return jsonify({"error": "Illegal move"}), 400
+        session.push(move)
+
+        if board.is_game_over():
+            result = get_game_result(board)
+            return jsonify({
+                "game_id": session.game_id,
+                "player_move": move_uci,
+                "ai_move": None,  # Explicitly state no AI move
+                "game_over": True,
+                "result": result
+            })
+
+        # No retries: the pool replaces engines that fail, and the player's move is
+        # taken back so the client can resend it
+        try:
+            ai_move = get_ai_move(engine_pool, board, game=session.game_key, timeout=MOVE_CHECKOUT_TIMEOUT)
+        except EngineUnavailable as e:
+            logging.warning(f"Engine unavailable: {e}")
+            session.pop()
+            return jsonify({"error": "No engine available, try again"}), 503
+        except chess.engine.EngineError as e:
+            logging.error(f"Engine error: {e}")
+            session.pop()
+            return jsonify({"error": f"Engine error: {e}"}), 500
+        session.push(ai_move)
+        if board.is_game_over():
+            result = get_game_result(board)
+            return jsonify({
+                "game_id": session.game_id,
+                "player_move": move_uci,
+                "ai_move": ai_move.uci(),
+                "game_over": True,
+                "result": result
+            })
+        return jsonify({"game_id": session.game_id, "player_move": move_uci, "ai_move": ai_move.uci()})
+
 @app.route('/reset', methods=['POST'])
 def reset_game():
-    global board, engine
-    board.reset()
-    if engine:
-        engine.quit()
-    engine = initialize_engine()
-    if not engine:
-        return jsonify({"error": "Failed to initialize chess engine"}), 500
-    return jsonify({"status": "Game reset"})
+    data = request.get_json(silent=True) or {}
+    session = lookup_session(data.get('game_id'))
+    if session is None:
+        return jsonify({"error": "Unknown game"}), 404
+    with session.lock:
+        session.reset()
+    return jsonify({"status": "Game reset", "game_id": session.game_id})
 
 @app.route('/board', methods=['GET'])
 def get_board():
-    return jsonify({"fen": board.fen()})
+    session = lookup_session(request.args.get('game_id'))
+    if session is None:
+        return jsonify({"error": "Unknown game"}), 404
+    # The FEN is published after every move, so reads never wait on the game lock
+    return jsonify({"fen": session.fen, "game_id": session.game_id})
+
+def parse_limit(data):
+    if not data:
+        return AI_MOVE_LIMIT
+    if not isinstance(data, dict):
+        raise ValueError("limit must be an object")
+    time_limit = data.get('time')
+    depth = data.get('depth')
+    nodes = data.get('nodes')
+    if time_limit is None and depth is None and nodes is None:
+        return AI_MOVE_LIMIT
+    return chess.engine.Limit(
+        time=min(float(time_limit), MAX_BATCH_TIME) if time_limit is not None else MAX_BATCH_TIME,
+        depth=int(depth) if depth is not None else None,
+        nodes=int(nodes) if nodes is not None else None,
+    )
+
+def parse_position(item, default_limit):
+    """Splits a FEN string or {"fen": ..., "limit": ...} object into (fen, limit)."""
+    if isinstance(item, str):
+        return item, default_limit
+    if not isinstance(item, dict):
+        raise ValueError("Position must be a FEN string or an object")
+    return item.get('fen'), item.get('limit', default_limit)
+
+def iter_positions(positions, default_limit):
+    """Yields (fen, limit, error) for each position of a JSON list or an NDJSON stream.
+
+    A position that cannot be parsed yields an error instead of ending the
+    stream, so the positions after it are still answered.
+    """
+    if positions is None:
+        # One position per line, read lazily so huge batches are never buffered
+        for line in request.stream:
+            line = line.strip()
+            if line:
+                try:
+                    yield (*parse_position(json.loads(line), default_limit), None)
+                except ValueError as e:
+                    yield None, None, f"Invalid position: {e}"
+    else:
+        for item in positions:
+            try:
+                yield (*parse_position(item, default_limit), None)
+            except ValueError as e:
+                yield None, None, f"Invalid position: {e}"
+
+def analyse_position(fen, limit_data):
+    try:
+        board = chess.Board(fen or "")
+        limit = parse_limit(limit_data)
+    except (TypeError, ValueError) as e:
+        return {"fen": fen, "error": f"Invalid position: {e}"}
+    if not board.is_valid():
+        return {"fen": fen, "error": "Invalid position"}
+    if board.is_game_over():
+        return {"fen": fen, "move": None, "result": get_game_result(board)}
+    try:
+        return {"fen": fen, "move": get_ai_move(engine_pool, board, limit=limit).uci()}
+    except chess.engine.EngineError as e:
+        return {"fen": fen, "error": f"Engine error: {e}"}
+
+@app.route('/moves', methods=['POST'])
+def batch_moves():
+    """Stateless batch analysis. Results are streamed as NDJSON in input order.
+
+    An application/x-ndjson body is read one line at a time. An
+    application/json body ({"positions": [...]}) is parsed whole, so it is
+    limited to MAX_JSON_BATCH_BYTES.
+    """
+    default_limit = request.args.get('time')
+    default_limit = {"time": default_limit} if default_limit else None
+    positions = None
+    if request.mimetype != 'application/x-ndjson':
+        if (request.content_length or 0) > MAX_JSON_BATCH_BYTES:
+            return jsonify({"error": "Batch too large for a JSON body; send it as NDJSON"}), 413
+        data = request.get_json(silent=True) or {}
+        positions = data.get('positions', []) if isinstance(data, dict) else None
+        if not isinstance(positions, list):
+            return jsonify({"error": "Expected {\"positions\": [...]}"}), 400
+    positions = iter_positions(positions, default_limit)
+    window = engine_pool.size * 2
+
+    def generate():
+        pending = deque()
+        for index, (fen, limit_data, error) in enumerate(positions):
+            if error is not None:
+                future = Future()
+                future.set_result({"fen": fen, "error": error})
+            else:
+                future = batch_executor.submit(analyse_position, fen, limit_data)
+            pending.append((index, future))
+            # Only a bounded window of positions is in flight at any time
+            while len(pending) >= window or (pending and pending[0][1].done()):
+                index_done, future = pending.popleft()
+                yield json.dumps({"index": index_done, **future.result()}) + "\n"
+        while pending:
+            index_done, future = pending.popleft()
+            yield json.dumps({"index": index_done, **future.result()}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/stats', methods=['GET'])
+def get_stats():
+    return jsonify({
+        "sessions": len(sessions),
+        "backend": BACKEND,
+        "engines": engine_pool.stats(),
+        "move_cache": move_cache.stats(),
+    })
 
-def get_ai_move(engine, board):
-    if not engine:
-        raise chess.engine.EngineTerminatedError("Engine not initialized")
-    result = engine.play(board, chess.engine.Limit(time=0.1))
-    return result.move
+def get_ai_move(pool, board, game=None, limit=AI_MOVE_LIMIT, timeout=None):
+    # The book holds replies searched at the game's limit; other limits ask the engine
+    if limit == AI_MOVE_LIMIT:
+        move = book_move(opening_book, board)
+        if move is not None:
+            return move
+    move = move_cache.get(board, limit)
+    if move is None:
+        move = pool.play(board, limit, game=game, timeout=timeout)
+        move_cache.put(board, limit, move)
+    return move
 
 def get_game_result(board):
     if board.is_checkmate():
@@ -0,0 +1,98 @@
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+_STOP = object()
+
+class MicroBatcher:
+    """Collects concurrent requests into batches for a single batched call.
+
+    `fn` takes a list of items and returns a list of results in the same
+    order. A batch is dispatched as soon as it holds `max_batch_size` items or
+    `max_wait` seconds have passed since its first item arrived. `close`
+    dispatches what is queued and stops the worker thread.
+    """
+
+    def __init__(self, fn, max_batch_size=32, max_wait=0.002):
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._items = 0
+        self._batches = 0
+        self._busy_time = 0.0
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item):
+        return self.submit(item).result()
+
+    def _collect(self):
+        """The next batch, and whether `close` was called after it."""
+        batch = []
+        entry = self._queue.get()
+        deadline = time.monotonic() + self.max_wait
+        while entry is not _STOP:
+            batch.append(entry)
+            if len(batch) >= self.max_batch_size:
+                return batch, False
+            remaining = deadline - time.monotonic()
+            try:
+                # Drain whatever is already queued even once the deadline has passed
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                return batch, False
+        return batch, True
+
+    def _run(self):
+        while True:
+            batch, stop = self._collect()
+            if batch:
+                self._dispatch(batch)
+            if stop:
+                return
+
+    def _dispatch(self, batch):
+        items = [item for item, _ in batch]
+        start = time.perf_counter()
+        try:
+            results = self.fn(items)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        finally:
+            with self._lock:
+                self._batches += 1
+                self._items += len(batch)
+                self._batch_sizes[len(batch)] += 1
+                self._busy_time += time.perf_counter() - start
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def close(self):
+        """Dispatches the requests already queued, then stops the worker thread."""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "batches": self._batches,
+                "items": self._items,
+                "mean_batch_size": self._items / self._batches if self._batches else 0.0,
+                "batch_sizes": {str(size): count for size, count in sorted(self._batch_sizes.items())},
+                "busy_seconds": self._busy_time,
+            }
@@ -0,0 +1,148 @@
+import argparse
+import logging
+import os
+import struct
+import sys
+import time
+from multiprocessing import Pool
+
+import chess
+import chess.engine
+import chess.polyglot
+
+ENTRY = struct.Struct(">QHHI")  # key, move, weight, learn
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BOOK_PATH = os.path.join(current_dir, "book.bin")
+DEFAULT_MODEL_PATH = os.path.join(current_dir, "model.pb.gz")
+
+def open_book(path=DEFAULT_BOOK_PATH):
+    """Returns a Polyglot reader for `path`, or None if there is no book."""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        return chess.polyglot.open_reader(path)
+    except Exception as e:
+        logging.error(f"Error opening book {path}: {e}")
+        return None
+
+def book_move(reader, board):
+    if reader is None:
+        return None
+    entry = reader.get(board)
+    return entry.move if entry else None
+
+def encode_polyglot_move(board, move):
+    """Encodes a move the way Polyglot stores it (castling as king takes rook)."""
+    to_square = move.to_square
+    if board.is_castling(move):
+        rank = chess.square_rank(move.from_square)
+        to_square = chess.square(7 if board.is_kingside_castling(move) else 0, rank)
+    promotion = move.promotion - 1 if move.promotion else 0  # knight=1 ... queen=4
+    return (to_square
+            | (move.from_square << 6)
+            | (promotion << 12))
+
+def write_book(path, entries):
+    """Writes {zobrist_key: polyglot_move} as a sorted Polyglot book."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        for key in sorted(entries):
+            f.write(ENTRY.pack(key, entries[key], 1, 0))
+    os.replace(tmp_path, path)
+
+# Each worker process owns one engine for the whole build
+_engine = None
+_limit = None
+
+def _init_worker(command, limit):
+    global _engine, _limit
+    _engine = chess.engine.SimpleEngine.popen_uci(command)
+    _limit = limit
+
+def _engine_reply(moves):
+    board = _board_from(moves)
+    # A fresh game per position, so the reply does not depend on search order
+    result = _engine.play(board, _limit, game=object())
+    return moves, result.move.uci() if result.move else None
+
+def build_book(command, depth=8, workers=4, limit=chess.engine.Limit(time=0.1)):
+    """Walks the opening tree to `depth` plies and records the engine's reply.
+
+    The tree covers every position the bot can face playing either colour:
+    on the bot's turn only its own reply is followed, on the opponent's turn
+    every legal move is. Transpositions are searched once.
+    """
+    entries = {}
+    replies = {}
+    with Pool(workers, initializer=_init_worker, initargs=(command, limit)) as pool:
+        for bot_color in (chess.WHITE, chess.BLACK):
+            frontier = [[]]
+            for ply in range(depth):
+                bot_to_move = (ply % 2 == 0) == (bot_color == chess.WHITE)
+                start = time.time()
+                next_frontier = []
+                seen = set()
+
+                if bot_to_move:
+                    pending = []
+                    for moves in frontier:
+                        board = _board_from(moves)
+                        key = chess.polyglot.zobrist_hash(board)
+                        if key in seen:
+                            continue
+                        seen.add(key)
+                        if key in replies:
+                            next_frontier.append(moves + [replies[key]])
+                        else:
+                            pending.append(moves)
+
+                    for moves, reply in pool.imap_unordered(_engine_reply, pending, chunksize=16):
+                        if reply is None:
+                            continue
+                        board = _board_from(moves)
+                        move = chess.Move.from_uci(reply)
+                        key = chess.polyglot.zobrist_hash(board)
+                        entries[key] = encode_polyglot_move(board, move)
+                        replies[key] = reply
+                        next_frontier.append(moves + [reply])
+                    searched = len(pending)
+                else:
+                    for moves in frontier:
+                        board = _board_from(moves)
+                        for move in board.legal_moves:
+                            board.push(move)
+                            key = chess.polyglot.zobrist_hash(board)
+                            if key not in seen and not board.is_game_over():
+                                seen.add(key)
+                                next_frontier.append(moves + [move.uci()])
+                            board.pop()
+                    searched = 0
+
+                print(f"{'White' if bot_color else 'Black'} ply {ply + 1}/{depth}: "
+                      f"{len(frontier)} positions, {searched} searched, "
+                      f"{len(entries)} book entries, {time.time() - start:.1f}s", file=sys.stderr)
+                frontier = next_frontier
+
+    return entries
+
+def _board_from(moves):
+    board = chess.Board()
+    for uci in moves:
+        board.push_uci(uci)
+    return board
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a Polyglot opening book from the engine's own replies.")
+    parser.add_argument("--depth", type=int, default=8, help="Depth of the opening tree in plies")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of engine processes")
+    parser.add_argument("--time", type=float, default=0.1, help="Search time per position in seconds")
+    parser.add_argument("--weights", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--output", default=DEFAULT_BOOK_PATH)
+    args = parser.parse_args()
+
+    command = ["lc0", f"--weights={args.weights}"]
+    entries = build_book(command, depth=args.depth, workers=args.workers,
+                         limit=chess.engine.Limit(time=args.time))
+    write_book(args.output, entries)
+    print(f"Wrote {len(entries)} entries to {args.output}", file=sys.stderr)
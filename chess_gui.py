@@ -3,6 +3,7 @@ import os
 import sys
 import chess
 import chess.engine
+from book import open_book, book_move
 from PyQt5.QtWidgets import QApplication, QWidget, QPushButton, QLabel, QVBoxLayout, QHBoxLayout, QListWidget, QDialog, QGridLayout
 from PyQt5.QtGui import QPixmap, QIcon, QPainter, QColor, QPen
 from PyQt5.QtCore import Qt, QSize, QRect, QPropertyAnimation, QEasingCurve, QPoint, QTimer
@@ -59,6 +60,8 @@ class ChessGUI(QWidget):
         if not os.path.exists(model_path):
             raise FileNotFoundError(f"Maia model file not found: {model_path}")
         
+        self.book = open_book(os.path.join(current_dir, "book.bin"))
+
         lc0_command = ["lc0", f"--weights={model_path}"]
         try:
             self.engine = chess.engine.SimpleEngine.popen_uci(lc0_command)
@@ -234,9 +237,11 @@ class ChessGUI(QWidget):
 
     def make_ai_move(self):
         try:
-            result = self.engine.play(self.board, chess.engine.Limit(time=0.1))
-            self.last_move = result.move
-            self.animate_move(result.move)
+            move = book_move(self.book, self.board)
+            if move is None:
+                move = self.engine.play(self.board, chess.engine.Limit(time=0.1)).move
+            self.last_move = move
+            self.animate_move(move)
             QTimer.singleShot(300, self.after_move)
         except Exception as e:
             print(f"Error making AI move: {e}")
@@ -0,0 +1,139 @@
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+
+import chess
+import chess.engine
+
+class EngineUnavailable(chess.engine.EngineError):
+    """No engine became idle within the checkout timeout."""
+
+class EnginePool:
+    """A fixed-size pool of warm UCI engine processes.
+
+    Engines are started and warmed up once, then checked out for a single
+    search and returned. Engines that crash or fail a health check are
+    discarded and replaced by a background thread, so callers only ever see
+    live engines. An engine that fails to start is retried up to
+    `max_spawn_attempts` times, doubling `respawn_delay` each time.
+    """
+
+    def __init__(self, command, size=1, health_check_interval=30.0, checkout_timeout=10.0, respawn_delay=5.0,
+                 max_spawn_attempts=5):
+        self.command = command
+        self.size = size
+        self.health_check_interval = health_check_interval
+        self.checkout_timeout = checkout_timeout
+        self.respawn_delay = respawn_delay
+        self.max_spawn_attempts = max_spawn_attempts
+
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._live = 0
+        self._closed = threading.Event()
+
+        # Warm the engines up in parallel; loading the network dominates startup
+        starters = [threading.Thread(target=self._spawn, daemon=True) for _ in range(size)]
+        for thread in starters:
+            thread.start()
+        for thread in starters:
+            thread.join()
+
+        self._health_thread = threading.Thread(target=self._health_loop, daemon=True)
+        self._health_thread.start()
+
+    @property
+    def live(self):
+        return self._live
+
+    def _start_engine(self):
+        engine = chess.engine.SimpleEngine.popen_uci(self.command)
+        # lc0 only loads its weights on the first search, so do one up front
+        engine.play(chess.Board(), chess.engine.Limit(nodes=1))
+        return engine
+
+    def _spawn(self, attempt=1):
+        try:
+            engine = self._start_engine()
+        except Exception as e:
+            logging.error(f"Error initializing engine (attempt {attempt}/{self.max_spawn_attempts}): {e}")
+            if self._closed.is_set():
+                return
+            if attempt >= self.max_spawn_attempts:
+                # Most likely a missing or misconfigured binary; retrying forever would not help
+                logging.error(f"Giving up on starting an engine; the pool runs with {self._live}/{self.size} engines")
+                return
+            retry = threading.Timer(self.respawn_delay * 2 ** (attempt - 1), self._spawn, args=(attempt + 1,))
+            retry.daemon = True
+            retry.start()
+            return
+        with self._lock:
+            self._live += 1
+        self._idle.put(engine)
+
+    def _discard(self, engine):
+        with self._lock:
+            self._live -= 1
+        try:
+            engine.quit()
+        except Exception:
+            pass
+        if not self._closed.is_set():
+            threading.Thread(target=self._spawn, daemon=True).start()
+
+    @contextmanager
+    def checkout(self, timeout=None):
+        try:
+            engine = self._idle.get(timeout=self.checkout_timeout if timeout is None else timeout)
+        except queue.Empty:
+            raise EngineUnavailable("No engine available")
+        try:
+            yield engine
+        except chess.engine.EngineTerminatedError:
+            logging.warning("Engine terminated. Replacing it in the background...")
+            self._discard(engine)
+            raise
+        except BaseException:
+            self._idle.put(engine)
+            raise
+        else:
+            self._idle.put(engine)
+
+    def play(self, board, limit, game=None, timeout=None):
+        """Runs one search on a pooled engine. `game` keys the engine's game state:
+        when it differs from the engine's previous game, `ucinewgame` is sent.
+        `timeout` overrides the checkout timeout."""
+        with self.checkout(timeout) as engine:
+            return engine.play(board, limit, game=game).move
+
+    def stats(self):
+        return {"live": self._live, "idle": self._idle.qsize(), "size": self.size}
+
+    def _health_loop(self):
+        while not self._closed.wait(self.health_check_interval):
+            # Only check engines that are idle right now, one at a time
+            for _ in range(self._idle.qsize()):
+                try:
+                    engine = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    engine.ping()
+                except Exception:
+                    logging.warning("Engine failed health check. Replacing it...")
+                    self._discard(engine)
+                else:
+                    self._idle.put(engine)
+
+    def close(self):
+        self._closed.set()
+        while True:
+            try:
+                engine = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                engine.quit()
+            except Exception:
+                pass
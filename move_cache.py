@@ -0,0 +1,121 @@
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import chess
+import chess.polyglot
+
+from sessions import decode_move, encode_move
+
+def limit_key(limit):
+    return (limit.time, limit.depth, limit.nodes)
+
+class MoveCache:
+    """Caches engine replies by position (Zobrist hash) and search limit.
+
+    The first tier is an in-process LRU. If `shared_path` is given, a SQLite
+    database at that path is used as a second tier shared by every worker
+    process on the host. Cached moves are checked for legality before they
+    are returned, so a hash collision can only cost a cache miss.
+    """
+
+    def __init__(self, max_entries=100000, shared_path=None):
+        self.max_entries = max_entries
+        self.shared_path = shared_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+        if shared_path:
+            with self._connection() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS moves ("
+                    "hash INTEGER NOT NULL, lim TEXT NOT NULL, move INTEGER NOT NULL, "
+                    "PRIMARY KEY (hash, lim))"
+                )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.shared_path, timeout=1.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _shared_key(key):
+        zobrist, limit = key
+        # SQLite integers are signed 64-bit
+        if zobrist >= 1 << 63:
+            zobrist -= 1 << 64
+        return zobrist, repr(limit)
+
+    def get(self, board, limit):
+        key = (chess.polyglot.zobrist_hash(board), limit_key(limit))
+        with self._lock:
+            code = self._entries.get(key)
+            if code is not None:
+                self._entries.move_to_end(key)
+
+        shared = False
+        if code is None and self.shared_path:
+            try:
+                row = self._connection().execute(
+                    "SELECT move FROM moves WHERE hash = ? AND lim = ?", self._shared_key(key)
+                ).fetchone()
+            except sqlite3.Error:
+                row = None
+            if row is not None:
+                code, shared = row[0], True
+
+        if code is not None:
+            move = decode_move(code)
+            # A hash collision can return another position's move; only count and keep legal ones
+            if board.is_legal(move):
+                if shared:
+                    self._remember(key, code)
+                with self._lock:
+                    self.hits += 1
+                    if shared:
+                        self.shared_hits += 1
+                return move
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, board, limit, move):
+        key = (chess.polyglot.zobrist_hash(board), limit_key(limit))
+        code = encode_move(move)
+        self._remember(key, code)
+        if self.shared_path:
+            try:
+                with self._connection() as conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO moves (hash, lim, move) VALUES (?, ?, ?)",
+                        self._shared_key(key) + (code,)
+                    )
+            except sqlite3.Error:
+                pass  # The shared tier is best effort
+
+    def _remember(self, key, code):
+        with self._lock:
+            self._entries[key] = code
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,145 @@
+import threading
+import time
+import uuid
+from array import array
+from collections import OrderedDict
+
+import chess
+
+
+def encode_move(move):
+    """Packs a move into 16 bits: from (6) | to (6) | promotion piece type (3)."""
+    return move.from_square | (move.to_square << 6) | ((move.promotion or 0) << 12)
+
+def decode_move(code):
+    promotion = (code >> 12) & 7
+    return chess.Move(code & 63, (code >> 6) & 63, promotion=promotion or None)
+
+class GameSession:
+    """State of a single game.
+
+    The move list is the source of truth and is stored as packed 16-bit codes.
+    The `chess.Board` is only a cache: it is rebuilt from the moves on demand
+    and dropped again by the store once the game goes idle.
+    """
+    __slots__ = ('game_id', 'generation', 'moves', 'fen', 'last_active', 'lock', '_board')
+
+    def __init__(self, game_id):
+        self.game_id = game_id
+        self.generation = 0
+        self.moves = array('H')
+        self.fen = chess.STARTING_FEN  # Published after every change, read without locking
+        self.last_active = time.monotonic()
+        self.lock = threading.Lock()
+        self._board = None
+
+    @property
+    def game_key(self):
+        """Identifies this game to the engines; changes whenever the game is reset."""
+        return (self.game_id, self.generation)
+
+    @property
+    def board(self):
+        if self._board is None:
+            board = chess.Board()
+            for code in self.moves:
+                board.push(decode_move(code))
+            self._board = board
+        return self._board
+
+    def push(self, move):
+        board = self.board
+        board.push(move)
+        self.moves.append(encode_move(move))
+        self.fen = board.fen()
+
+    def pop(self):
+        """Takes back the last move."""
+        board = self.board
+        move = board.pop()
+        self.moves.pop()
+        self.fen = board.fen()
+        return move
+
+    def reset(self):
+        self.generation += 1
+        self.moves = array('H')
+        self._board = None
+        self.fen = chess.STARTING_FEN
+
+    def drop_board(self):
+        # Never drop the board out from under a move that is in progress
+        if self.lock.acquire(blocking=False):
+            try:
+                self._board = None
+            finally:
+                self.lock.release()
+
+class SessionStore:
+    """Thread-safe registry of games, kept in least-recently-used order.
+
+    Sessions idle for longer than `idle_timeout` seconds are evicted, boards of
+    sessions idle for longer than `board_idle_timeout` are released, and the
+    least recently used game is evicted once `max_sessions` is reached.
+    """
+
+    def __init__(self, max_sessions=10000, idle_timeout=3600, board_idle_timeout=60, sweep_interval=10):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.board_idle_timeout = board_idle_timeout
+        self.sweep_interval = sweep_interval
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def create(self, game_id=None):
+        session = GameSession(game_id or uuid.uuid4().hex)
+        with self._lock:
+            self._maybe_sweep()
+            while len(self._sessions) >= self.max_sessions:
+                self._sessions.popitem(last=False)
+            self._sessions[session.game_id] = session
+        return session
+
+    def get(self, game_id, touch=True):
+        with self._lock:
+            session = self._sessions.get(game_id)
+            if session is not None and touch:
+                session.last_active = time.monotonic()
+                self._sessions.move_to_end(game_id)
+        return session
+
+    def get_or_create(self, game_id):
+        session = self.get(game_id)
+        if session is None:
+            session = self.create(game_id)
+        return session
+
+    def delete(self, game_id):
+        with self._lock:
+            return self._sessions.pop(game_id, None) is not None
+
+    def sweep(self):
+        with self._lock:
+            self._sweep()
+
+    def _maybe_sweep(self):
+        if time.monotonic() - self._last_sweep >= self.sweep_interval:
+            self._sweep()
+
+    def _sweep(self):
+        now = time.monotonic()
+        self._last_sweep = now
+        # Oldest first, so we can stop at the first session that is still warm
+        for game_id in list(self._sessions):
+            session = self._sessions[game_id]
+            idle = now - session.last_active
+            if idle >= self.idle_timeout:
+                del self._sessions[game_id]
+            elif idle >= self.board_idle_timeout:
+                session.drop_board()
+            else:
+                break
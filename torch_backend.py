@@ -0,0 +1,49 @@
+import os
+import sys
+
+import torch
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(current_dir, "train"))
+
+from play import load_model, get_ai_move as model_move, get_ai_moves as model_moves
+from batching import MicroBatcher
+
+class TorchBackend:
+    """Plays moves in-process with a ChessCNN checkpoint.
+
+    Exposes the same `play` interface as `EnginePool`, so the app can use either.
+    The search limit is ignored: a move is a single forward pass. With
+    `max_batch_size` > 1, concurrent requests are batched into one forward
+    pass by a `MicroBatcher`.
+    """
+
+    def __init__(self, model_path, size=1, num_threads=None, max_batch_size=1, max_wait=0.002):
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Model file not found: {model_path}")
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self.model = load_model(model_path)
+        # Number of requests served concurrently; enough to fill a batch
+        self.size = max(size, max_batch_size)
+        self.live = 1
+        self.batcher = None
+        if max_batch_size > 1:
+            self.batcher = MicroBatcher(lambda boards: model_moves(self.model, boards),
+                                        max_batch_size=max_batch_size, max_wait=max_wait)
+
+    def play(self, board, limit=None, game=None, timeout=None):
+        if self.batcher:
+            # The caller waits for the result, so the board is not mutated meanwhile
+            return self.batcher(board)
+        return model_move(self.model, board)
+
+    def stats(self):
+        stats = {"live": self.live, "size": self.size}
+        if self.batcher:
+            stats["batching"] = self.batcher.stats()
+        return stats
+
+    def close(self):
+        if self.batcher:
+            self.batcher.close()
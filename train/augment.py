@@ -0,0 +1,33 @@
+import numpy as np
+import torch
+import chess
+
+from moves import INDEX_FROM, INDEX_TO
+
+# Mirroring flips the board along the rank axis and swaps the colours
+SQUARE_MIRROR = np.array([chess.square_mirror(square) for square in chess.SQUARES], dtype=np.int64)
+MOVE_MIRROR = torch.from_numpy(SQUARE_MIRROR[INDEX_FROM] * 64 + SQUARE_MIRROR[INDEX_TO])
+CHANNEL_SWAP = torch.tensor([6, 7, 8, 9, 10, 11, 0, 1, 2, 3, 4, 5])
+
+def mirror_batch(inputs, labels, mask=None):
+    """Mirrors a whole batch: (N, 12, 8, 8) inputs, (N,) move indices and optional (N, 4096) masks."""
+    device = inputs.device
+    inputs = inputs.flip(2)[:, CHANNEL_SWAP.to(device)]
+    move_mirror = MOVE_MIRROR.to(device)
+    labels = move_mirror[labels]
+    if mask is not None:
+        # The move mirror is its own inverse, so gathering with it permutes the mask
+        mask = mask[:, move_mirror]
+    return inputs, labels, mask
+
+def random_mirror(inputs, labels, mask=None, p=0.5, generator=None):
+    """Mirrors each sample of the batch independently with probability `p`."""
+    if p <= 0:
+        return inputs, labels, mask
+    flip = (torch.rand(inputs.shape[0], generator=generator) < p).to(inputs.device)
+    mirrored_inputs, mirrored_labels, mirrored_mask = mirror_batch(inputs, labels, mask)
+    inputs = torch.where(flip[:, None, None, None], mirrored_inputs, inputs)
+    labels = torch.where(flip, mirrored_labels, labels)
+    if mask is not None:
+        mask = torch.where(flip[:, None], mirrored_mask, mask)
+    return inputs, labels, mask
@@ -0,0 +1,175 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+from encode import boards_to_tensor
+from export import DEFAULT_POSITIONS, export_torchscript, quantize_model, read_positions
+from moves import legal_move_indices, legal_move_mask
+from play import load_model, policy_logits, decode_policy, scores_legal_only
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(current_dir, ".."))
+
+from batching import MicroBatcher
+
+BACKENDS = ("eager", "torchscript", "quantized", "quantized_torchscript", "microbatch")
+
+def load_backends(checkpoint, names, work_dir):
+    """Builds each backend from one checkpoint, as the serving code would load it."""
+    eager = load_model(checkpoint)
+    backends = {}
+    for name in names:
+        if name in ("eager", "microbatch"):
+            backends[name] = eager
+        elif name == "torchscript":
+            path = os.path.join(work_dir, "model.pt")
+            export_torchscript(eager, path)
+            backends[name] = load_model(path)
+        elif name == "quantized":
+            backends[name] = quantize_model(eager)
+        elif name == "quantized_torchscript":
+            path = os.path.join(work_dir, "model_int8.pt")
+            export_torchscript(quantize_model(eager), path)
+            backends[name] = load_model(path)
+        else:
+            raise ValueError(f"Unknown backend {name!r}, expected one of {BACKENDS}")
+    return backends
+
+def get_moves(model, boards):
+    input_tensor = torch.from_numpy(boards_to_tensor(boards))
+    return decode_policy(model, policy_logits(model, input_tensor, boards), boards)
+
+def time_stages(model, boards, batch_size, repeats):
+    """Per-batch encode, move generation, forward and decode times in ms, over the whole corpus `repeats` times.
+
+    Move generation is the legal move list of a legal-only model, or the
+    legal move mask of a full-policy one, so `forward_ms` is the model alone.
+    """
+    encode, movegen, forward, decode = [], [], [], []
+    batches = [boards[i:i + batch_size] for i in range(0, len(boards), batch_size)]
+    legal_only = scores_legal_only(model)
+    get_moves(model, batches[0])  # Warm up
+    for _ in range(repeats):
+        for batch in batches:
+            legal = mask = None
+            start = time.perf_counter()
+            input_tensor = torch.from_numpy(boards_to_tensor(batch))
+            encoded = time.perf_counter()
+            if legal_only:
+                legal = legal_move_indices(batch)
+            else:
+                mask = legal_move_mask(batch)
+            generated = time.perf_counter()
+            output = policy_logits(model, input_tensor, batch, legal)
+            forwarded = time.perf_counter()
+            decode_policy(model, output, batch, mask)
+            done = time.perf_counter()
+            encode.append((encoded - start) * 1000)
+            movegen.append((generated - encoded) * 1000)
+            forward.append((forwarded - generated) * 1000)
+            decode.append((done - forwarded) * 1000)
+    total = [e + m + f + d for e, m, f, d in zip(encode, movegen, forward, decode)]
+    return {
+        "batches": len(total),
+        "encode_ms": statistics.mean(encode),
+        "movegen_ms": statistics.mean(movegen),
+        "forward_ms": statistics.mean(forward),
+        "decode_ms": statistics.mean(decode),
+        "total_ms": statistics.mean(total),
+        "total_p50_ms": statistics.median(total),
+        "total_p90_ms": statistics.quantiles(total, n=10)[-1] if len(total) > 1 else total[0],
+        "positions_per_s": len(boards) * repeats / (sum(total) / 1000),
+    }
+
+def time_microbatch(model, boards, batch_size, repeats):
+    """Single-position requests from `batch_size` threads, grouped by the server's MicroBatcher."""
+    batcher = MicroBatcher(lambda batch: get_moves(model, batch), max_batch_size=batch_size, max_wait=0.002)
+    latencies = []
+
+    def request(board):
+        start = time.perf_counter()
+        batcher(board)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    try:
+        with ThreadPoolExecutor(max_workers=batch_size) as executor:
+            list(executor.map(request, boards[:batch_size]))  # Warm up
+            latencies.clear()
+            start = time.perf_counter()
+            for _ in range(repeats):
+                list(executor.map(request, boards))
+            elapsed = time.perf_counter() - start
+    finally:
+        # A leftover worker thread would compete for the cores in later configurations
+        batcher.close()
+    stats = batcher.stats()
+    return {
+        "requests": len(latencies),
+        "mean_batch_size": stats["mean_batch_size"],
+        "total_ms": statistics.mean(latencies),
+        "total_p50_ms": statistics.median(latencies),
+        "total_p90_ms": statistics.quantiles(latencies, n=10)[-1],
+        "positions_per_s": len(boards) * repeats / elapsed,
+    }
+
+def run_benchmark(checkpoint, backends=BACKENDS, batch_sizes=(1, 8, 32), threads=(1, 2, 4),
+                  positions=DEFAULT_POSITIONS, repeats=5):
+    boards = read_positions(positions)
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        models = load_backends(checkpoint, backends, work_dir)
+        for num_threads in threads:
+            torch.set_num_threads(num_threads)
+            for name, model in models.items():
+                for batch_size in batch_sizes:
+                    if name == "microbatch":
+                        if batch_size == 1:
+                            continue  # Same as eager
+                        timings = time_microbatch(model, boards, batch_size, repeats)
+                    else:
+                        timings = time_stages(model, boards, batch_size, repeats)
+                    result = {"backend": name, "batch_size": batch_size, "threads": num_threads, **timings}
+                    results.append(result)
+                    print(f"{name:22s} batch {batch_size:3d} threads {num_threads}: "
+                          f"{result['total_ms']:8.3f} ms per {'request' if name == 'microbatch' else 'batch'}, "
+                          f"{result['positions_per_s']:10,.0f} positions/s")
+    return {
+        "checkpoint": os.path.basename(checkpoint),
+        "positions": len(boards),
+        "repeats": repeats,
+        "torch": torch.__version__,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+def parse_ints(value):
+    return tuple(int(x) for x in value.split(","))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time move generation: encode, forward pass and decode.")
+    parser.add_argument("checkpoint", nargs="?", default="best_chess_model.pth")
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--batch-sizes", type=parse_ints, default=(1, 8, 32))
+    parser.add_argument("--threads", type=parse_ints, default=(1, 2, 4))
+    parser.add_argument("--positions", default=DEFAULT_POSITIONS, help="PGN file of benchmark positions")
+    parser.add_argument("--repeats", type=int, default=5, help="Passes over the positions per configuration")
+    parser.add_argument("--output", default="bench.json")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.checkpoint, backends=tuple(args.backends.split(",")),
+                           batch_sizes=args.batch_sizes, threads=args.threads,
+                           positions=args.positions, repeats=args.repeats)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(report['results'])} results to {args.output}")
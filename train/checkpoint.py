@@ -0,0 +1,180 @@
+import glob
+import os
+import queue
+import random
+import re
+import threading
+
+import numpy as np
+import torch
+
+CHECKPOINT_PATTERN = re.compile(r"checkpoint_e(\d+)_s(\d+)\.ckpt$")
+BEST_CHECKPOINT = "best.ckpt"
+
+def to_cpu(obj):
+    """Deep copy of a (nested) state dict with every tensor cloned to the CPU."""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return {key: to_cpu(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(to_cpu(value) for value in obj)
+    return obj
+
+def rng_state():
+    state = {
+        "torch": torch.get_rng_state(),
+        "numpy": np.random.get_state(),
+        "python": random.getstate(),
+    }
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+def set_rng_state(state):
+    torch.set_rng_state(state["torch"])
+    np.random.set_state(state["numpy"])
+    random.setstate(state["python"])
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+def snapshot(model, optimizer, scheduler, scaler, epoch, step, **progress):
+    """Copies the whole training state, so training can go on while it is written.
+
+    `epoch` is the current epoch and `step` the number of its batches already
+    trained on; `progress` holds the loop's own bookkeeping (losses so far,
+    early stopping counters).
+    """
+    return {
+        "epoch": epoch,
+        "step": step,
+        "model": to_cpu(model.state_dict()),
+        "optimizer": to_cpu(optimizer.state_dict()),
+        "scheduler": scheduler.state_dict(),
+        "scaler": scaler.state_dict(),
+        "rng": rng_state(),
+        "progress": progress,
+    }
+
+def restore(state, model, optimizer, scheduler, scaler):
+    """Loads a snapshot back into the training objects and returns its progress.
+
+    The random number generators are left alone: creating a DataLoader
+    iterator draws from them, so the loop restores `state["rng"]` with
+    set_rng_state once the resumed epoch's iterator exists.
+    """
+    model.load_state_dict(state["model"])
+    optimizer.load_state_dict(state["optimizer"])
+    scheduler.load_state_dict(state["scheduler"])
+    scaler.load_state_dict(state["scaler"])
+    return state["progress"]
+
+def save_atomic(obj, path):
+    """torch.save to a temporary file next to `path`, then rename it into place."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        torch.save(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def list_checkpoints(directory):
+    """Checkpoint paths in `directory`, oldest first."""
+    found = []
+    for path in glob.glob(os.path.join(directory, "checkpoint_e*_s*.ckpt")):
+        match = CHECKPOINT_PATTERN.search(path)
+        if match:
+            found.append(((int(match.group(1)), int(match.group(2))), path))
+    return [path for _, path in sorted(found)]
+
+def latest_checkpoint(directory):
+    checkpoints = list_checkpoints(directory)
+    return checkpoints[-1] if checkpoints else None
+
+def load_checkpoint(path):
+    return torch.load(path, map_location="cpu", weights_only=False)
+
+class CheckpointWriter:
+    """Writes snapshots on a background thread so the training loop does not stall.
+
+    Every file is written atomically. Of the periodic checkpoints only the
+    last `keep_last` are kept; the best one is kept separately as best.ckpt.
+    A checkpoint saved with `keep=True` is not pruned until it is
+    `release`d, e.g. once the validator has read it. Other files (e.g. the
+    plain state dicts play.load_model reads) can be queued with `write`.
+    """
+
+    def __init__(self, directory="checkpoints", keep_last=3):
+        self.directory = directory
+        self.keep_last = keep_last
+        os.makedirs(directory, exist_ok=True)
+        self._queue = queue.Queue(maxsize=2)  # Bounds the snapshots held in memory
+        self._error = None
+        self._kept = set()
+        self._kept_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, obj, path):
+        self._raise_error()
+        self._queue.put((obj, path, False))
+
+    def save_checkpoint(self, state, is_best=False, keep=False):
+        path = os.path.join(self.directory, f"checkpoint_e{state['epoch']:04d}_s{state['step']:08d}.ckpt")
+        if keep:
+            self.keep(path)
+        self.write(state, path)
+        self.prune()  # Once the checkpoint is on disk
+        if is_best:
+            self.write(state, os.path.join(self.directory, BEST_CHECKPOINT))
+        return path
+
+    def keep(self, path):
+        """Exempts the checkpoint at `path` from pruning."""
+        with self._kept_lock:
+            self._kept.add(path)
+
+    def release(self, path):
+        """Lets a kept checkpoint be pruned again, at the next prune."""
+        with self._kept_lock:
+            self._kept.discard(path)
+
+    def prune(self):
+        """Queues removal of all but the last `keep_last` checkpoints that are not kept."""
+        self._queue.put((None, None, True))
+
+    def _run(self):
+        while True:
+            obj, path, prune = self._queue.get()
+            try:
+                if prune:
+                    with self._kept_lock:
+                        kept = set(self._kept)
+                    prunable = [p for p in list_checkpoints(self.directory) if p not in kept]
+                    for old in prunable[:-self.keep_last or None]:
+                        os.remove(old)
+                elif path is not None:
+                    save_atomic(obj, path)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+            if path is None and not prune:
+                return
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError(f"Checkpoint writer failed: {error}") from error
+
+    def flush(self):
+        """Blocks until everything queued so far is on disk."""
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        """Prunes once more, so checkpoints released since the last save go too, and stops the writer."""
+        self.prune()
+        self._queue.put((None, None, False))
+        self._thread.join()
+        self._raise_error()
@@ -0,0 +1,116 @@
+import argparse
+import time
+from contextlib import nullcontext
+
+import torch
+import torch.optim as optim
+
+from load import create_data_loaders
+from model import build_model
+from losses import make_criterion
+
+PRECISIONS = ("auto", "fp32", "bf16")
+
+def configure_threads(threads=None, interop_threads=None):
+    """Sets the intra-op and inter-op thread pools; call before any parallel work."""
+    if threads:
+        torch.set_num_threads(threads)
+    if interop_threads:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError:
+            print("Inter-op threads can only be set before the first parallel operation; keeping the default.")
+
+def autocast_context(device, precision="auto"):
+    """Mixed precision for the forward pass.
+
+    "auto" keeps the original behaviour: float16 autocast on CUDA and plain
+    float32 on the CPU. "bf16" uses bfloat16 autocast on either, which needs
+    no GradScaler.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision {precision!r}, expected one of {PRECISIONS}")
+    if precision == "bf16":
+        return torch.autocast(device.type, dtype=torch.bfloat16)
+    if precision == "auto" and device.type == "cuda":
+        return torch.autocast("cuda", dtype=torch.float16)
+    return nullcontext()
+
+def prepare_model(model, channels_last=False, compile=False):
+    """Returns the module to call in the loop: channels-last and/or torch.compile'd.
+
+    The original `model` keeps its parameters and state_dict keys, so
+    checkpoints are saved from it unchanged.
+    """
+    if channels_last:
+        model.to(memory_format=torch.channels_last)
+    return torch.compile(model) if compile else model
+
+def prepare_inputs(inputs, channels_last=False):
+    return inputs.contiguous(memory_format=torch.channels_last) if channels_last else inputs
+
+def benchmark_steps(batches, arch="cnn", precision="fp32", channels_last=False, compile=False, warmup=3, seed=0):
+    """Training steps per second (forward, backward, Adam) over preloaded `batches`."""
+    torch.manual_seed(seed)
+    model = build_model(arch)
+    model.train()
+    forward_model = prepare_model(model, channels_last=channels_last, compile=compile)
+    criterion = make_criterion("ce")
+    optimizer = optim.Adam(model.parameters(), lr=0.001)
+    device = torch.device("cpu")
+
+    def step(batch):
+        inputs = prepare_inputs(batch[0], channels_last)
+        optimizer.zero_grad()
+        with autocast_context(device, precision):
+            outputs = forward_model(inputs)
+            loss = criterion(outputs, batch[1])
+        loss.backward()
+        optimizer.step()
+        return loss.item()
+
+    for batch in batches[:warmup]:
+        step(batch)  # Includes compilation
+    start = time.perf_counter()
+    for batch in batches[warmup:]:
+        loss = step(batch)
+    elapsed = time.perf_counter() - start
+    return (len(batches) - warmup) / elapsed, loss
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare CPU training steps/sec against the eager float32 loop.")
+    parser.add_argument("data_file")
+    parser.add_argument("--arch", default="cnn")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--interop-threads", type=int, default=None)
+    parser.add_argument("--no-compile", action="store_true", help="Skip the torch.compile configurations")
+    args = parser.parse_args()
+
+    configure_threads(args.threads, args.interop_threads)
+    train_loader, _ = create_data_loaders(args.data_file, batch_size=args.batch_size)
+    # The same batches for every configuration, loaded up front so only the step is timed
+    batches = []
+    while len(batches) < args.steps + 3:
+        batches.extend(batch for batch in train_loader if len(batch[1]) == args.batch_size)
+    batches = batches[:args.steps + 3]
+
+    configs = [
+        ("eager fp32", dict(precision="fp32")),
+        ("eager fp32 channels_last", dict(precision="fp32", channels_last=True)),
+        ("eager bf16", dict(precision="bf16")),
+        ("eager bf16 channels_last", dict(precision="bf16", channels_last=True)),
+    ]
+    if not args.no_compile:
+        configs += [
+            ("compiled fp32", dict(precision="fp32", compile=True)),
+            ("compiled bf16 channels_last", dict(precision="bf16", channels_last=True, compile=True)),
+        ]
+
+    print(f"{args.arch}, batch {args.batch_size}, {torch.get_num_threads()} threads, {args.steps} steps")
+    baseline = None
+    for name, config in configs:
+        steps_per_s, loss = benchmark_steps(batches, arch=args.arch, **config)
+        baseline = baseline or steps_per_s
+        print(f"{name:30s} {steps_per_s:8.2f} steps/s  {steps_per_s / baseline:5.2f}x  (last loss {loss:.4f})")
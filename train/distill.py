@@ -0,0 +1,59 @@
+import torch
+import torch.nn as nn
+from losses import make_criterion
+from play import load_model
+from train import train_model
+from validate import validation_loader, evaluate
+import time
+
+def measure_latency(model, batch_size=1, repeats=200, num_threads=1):
+    """Mean forward pass time in milliseconds, on `num_threads` CPU threads."""
+    previous_threads = torch.get_num_threads()
+    torch.set_num_threads(num_threads)
+    model = model.cpu().eval()
+    x = torch.zeros(batch_size, 12, 8, 8)
+    try:
+        with torch.no_grad():
+            for _ in range(10):
+                model(x)
+            start = time.perf_counter()
+            for _ in range(repeats):
+                model(x)
+        return (time.perf_counter() - start) / repeats * 1000
+    finally:
+        torch.set_num_threads(previous_threads)
+
+def distill_model(teacher_path="best_chess_model.pth", num_epochs=50, batch_size=1024, learning_rate=0.001,
+                  data_file="dataset.txt", student_arch="tiny", temperature=2.0, alpha=0.5, loss_type="ce",
+                  legal_mask=False, mirror_prob=0.5, checkpoint_dir="student_checkpoints", seed=0,
+                  validation_samples=10000, **kwargs):
+    """train_model with a teacher: the student learns from the dataset labels and the teacher's policy.
+
+    The teacher must be an eager .pth checkpoint; TorchScript and ONNX
+    exports cannot be moved to the training device, and frozen ones have no
+    parameters to count. Other keyword arguments go to train_model, so
+    checkpointing, resuming and the precision options work the same way.
+    """
+    teacher = load_model(teacher_path)
+    if not isinstance(teacher, nn.Module) or isinstance(teacher, torch.jit.ScriptModule):
+        raise ValueError(f"The teacher must be a .pth checkpoint, not {teacher_path}")
+
+    train_model(num_epochs=num_epochs, batch_size=batch_size, learning_rate=learning_rate, data_file=data_file,
+                loss_type=loss_type, legal_mask=legal_mask, mirror_prob=mirror_prob, arch=student_arch,
+                checkpoint_dir=checkpoint_dir, seed=seed, validation_samples=validation_samples,
+                teacher=teacher, temperature=temperature, alpha=alpha,
+                model_name="student_model", plot_path="distill_loss_plot.png", **kwargs)
+
+    # Accuracy/latency trade-off of the saved student against its teacher, on the validator's test subsample
+    student = load_model("best_student_model.pth")
+    loader = validation_loader(data_file, num_samples=validation_samples, batch_size=batch_size, seed=seed)
+    criterion = make_criterion(loss_type)
+    print(f"{'':8s} {'params':>12s} {'top-1':>8s} {'top-3':>8s} {'batch 1, 1 thread':>20s}")
+    for name, model in (("teacher", teacher.cpu()), ("student", student)):
+        metrics = evaluate(model, loader, criterion, legal_mask=legal_mask)
+        params = sum(p.numel() for p in model.parameters())
+        print(f"{name:8s} {params:12,d} {metrics['top1']:8.2%} {metrics['top3']:8.2%} "
+              f"{measure_latency(model):17.3f} ms")
+
+if __name__ == "__main__":
+    distill_model()
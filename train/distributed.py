@@ -0,0 +1,54 @@
+import argparse
+import os
+
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+from train import train_model
+
+def setup(backend="gloo"):
+    """Joins the process group described by the environment (RANK, WORLD_SIZE, MASTER_ADDR, ...)."""
+    dist.init_process_group(backend)
+    return dist.get_rank(), dist.get_world_size()
+
+def _worker(local_rank, args):
+    # The same variables torchrun sets
+    rank = args.node_rank * args.nproc_per_node + local_rank
+    os.environ.update({
+        "RANK": str(rank),
+        "LOCAL_RANK": str(local_rank),
+        "WORLD_SIZE": str(args.nnodes * args.nproc_per_node),
+        "MASTER_ADDR": args.master_addr,
+        "MASTER_PORT": str(args.master_port),
+    })
+    rank, world_size = setup()
+    # Split the host's cores between its ranks instead of oversubscribing them
+    threads = args.threads or max(1, (os.cpu_count() or 1) // args.nproc_per_node)
+    try:
+        train_model(num_epochs=args.epochs, batch_size=args.batch_size, learning_rate=args.learning_rate,
+                    data_file=args.data_file, arch=args.arch, legal_mask=args.legal_mask,
+                    checkpoint_dir=args.checkpoint_dir, threads=threads,
+                    streaming=args.streaming, num_workers=args.num_workers, rank=rank, world_size=world_size)
+    finally:
+        dist.destroy_process_group()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Data-parallel CPU training over torch.distributed (gloo).")
+    parser.add_argument("--data-file", default="dataset.txt")
+    parser.add_argument("--epochs", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=1024, help="Global batch size, split across all ranks")
+    parser.add_argument("--learning-rate", type=float, default=0.001)
+    parser.add_argument("--arch", default="cnn")
+    parser.add_argument("--legal-mask", action="store_true")
+    parser.add_argument("--checkpoint-dir", default="checkpoints")
+    parser.add_argument("--streaming", action="store_true", help="Stream the text file instead of loading it into memory")
+    parser.add_argument("--num-workers", type=int, default=0, help="DataLoader workers per rank")
+    parser.add_argument("--nproc-per-node", type=int, default=2, help="Ranks on this host")
+    parser.add_argument("--threads", type=int, default=None, help="Torch threads per rank (default: cores / ranks)")
+    parser.add_argument("--nnodes", type=int, default=1)
+    parser.add_argument("--node-rank", type=int, default=0)
+    parser.add_argument("--master-addr", default="127.0.0.1", help="Address of node 0")
+    parser.add_argument("--master-port", type=int, default=29500)
+    args = parser.parse_args()
+
+    mp.spawn(_worker, args=(args,), nprocs=args.nproc_per_node)
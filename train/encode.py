@@ -0,0 +1,102 @@
+import numpy as np
+import chess
+
+BOARD_SIZE = 8
+NUM_CHANNELS = 12  # 6 piece types x 2 colours, as in load.py
+
+# Channel order matches fen_to_tensor: black p, n, b, r, q, k then white P, N, B, R, Q, K
+CHANNEL_PIECES = [(piece_type, color)
+                  for color in (chess.BLACK, chess.WHITE)
+                  for piece_type in chess.PIECE_TYPES]
+
+# Maps one byte of a bitboard (one rank, a-file in bit 0) to its 8 normalized squares
+_BYTE_TABLE = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1, bitorder='little').astype(np.float32)
+_BYTE_TABLE /= 6.0  # Same normalization as fen_to_tensor
+
+def board_bitboards(boards, out=None):
+    """(N, 12) uint64 piece bitboards, in the channel order of the encoder."""
+    if out is None:
+        out = np.empty((len(boards), NUM_CHANNELS), dtype=np.uint64)
+    for i, board in enumerate(boards):
+        black, white = board.occupied_co[chess.BLACK], board.occupied_co[chess.WHITE]
+        out[i] = (board.pawns & black, board.knights & black, board.bishops & black,
+                  board.rooks & black, board.queens & black, board.kings & black,
+                  board.pawns & white, board.knights & white, board.bishops & white,
+                  board.rooks & white, board.queens & white, board.kings & white)
+    return out
+
+def bitboards_to_board(bitboards, turn=chess.WHITE):
+    """Rebuilds a chess.Board (no castling rights or en passant) from 12 bitboards."""
+    bb = [int(b) for b in bitboards]
+    board = chess.Board.empty()
+    board.pawns = bb[0] | bb[6]
+    board.knights = bb[1] | bb[7]
+    board.bishops = bb[2] | bb[8]
+    board.rooks = bb[3] | bb[9]
+    board.queens = bb[4] | bb[10]
+    board.kings = bb[5] | bb[11]
+    board.occupied_co[chess.BLACK] = bb[0] | bb[1] | bb[2] | bb[3] | bb[4] | bb[5]
+    board.occupied_co[chess.WHITE] = bb[6] | bb[7] | bb[8] | bb[9] | bb[10] | bb[11]
+    board.occupied = board.occupied_co[chess.BLACK] | board.occupied_co[chess.WHITE]
+    board.turn = bool(turn)
+    return board
+
+def bitboards_to_tensor(bitboards, out=None):
+    """Unpacks (N, 12) uint64 bitboards into an (N, 12, 8, 8) float32 array.
+
+    Row 0 is the eighth rank, as in fen_to_tensor, and the result is
+    bit-exact against it. Pass `out` to reuse a preallocated buffer.
+    """
+    bitboards = np.ascontiguousarray(bitboards, dtype='<u8')
+    n = bitboards.shape[0]
+    if out is None:
+        out = np.empty((n, NUM_CHANNELS, BOARD_SIZE, BOARD_SIZE), dtype=np.float32)
+    ranks = bitboards.view(np.uint8).reshape(n, NUM_CHANNELS, BOARD_SIZE)
+    # Byte 7 holds the eighth rank, so reverse the ranks on the way through
+    np.take(_BYTE_TABLE, ranks[:, :, ::-1], axis=0, out=out)
+    return out
+
+def boards_to_tensor(boards, out=None):
+    return bitboards_to_tensor(board_bitboards(boards), out=out)
+
+if __name__ == "__main__":
+    import os
+    import time
+    import chess.pgn
+    from stream import fen_to_tensor
+
+    pgn_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "preprocessing", "minidata.pgn")
+    boards = []
+    with open(pgn_path) as f:
+        while (game := chess.pgn.read_game(f)) is not None:
+            board = game.board()
+            for move in game.mainline_moves():
+                board.push(move)
+                boards.append(board.copy(stack=False))
+    fens = [board.fen() for board in boards]
+
+    expected = np.stack([fen_to_tensor(fen) for fen in fens])
+    assert np.array_equal(boards_to_tensor(boards), expected), "encoding differs from fen_to_tensor"
+    print(f"Bit-exact on {len(boards)} positions")
+
+    repeats = max(1, 20000 // len(boards))
+    batch = boards * repeats
+    fen_batch = fens * repeats
+    out = np.empty((len(batch), NUM_CHANNELS, BOARD_SIZE, BOARD_SIZE), dtype=np.float32)
+    bitboards = board_bitboards(batch)
+
+    start = time.perf_counter()
+    np.stack([fen_to_tensor(fen) for fen in fen_batch])
+    fen_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    boards_to_tensor(batch, out=out)
+    board_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    bitboards_to_tensor(bitboards, out=out)
+    unpack_time = time.perf_counter() - start
+
+    print(f"fen_to_tensor:        {len(batch) / fen_time:12,.0f} positions/s")
+    print(f"boards_to_tensor:     {len(batch) / board_time:12,.0f} positions/s")
+    print(f"bitboards_to_tensor:  {len(batch) / unpack_time:12,.0f} positions/s")
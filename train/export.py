@@ -0,0 +1,97 @@
+import argparse
+import os
+import time
+
+import chess
+import chess.pgn
+import torch
+import torch.nn as nn
+
+from encode import boards_to_tensor
+from moves import legal_move_mask, select_moves
+from play import load_model
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_POSITIONS = os.path.join(current_dir, "..", "preprocessing", "minidata.pgn")
+
+def quantize_model(model):
+    """Dynamically quantizes the Linear layers (fc1/fc2 of ChessCNN) to int8."""
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+def export_torchscript(model, path):
+    example = torch.zeros(1, 12, 8, 8)
+    with torch.no_grad():
+        scripted = torch.jit.freeze(torch.jit.trace(model, example))
+    torch.jit.save(scripted, path)
+    return scripted
+
+def export_onnx(model, path):
+    example = torch.zeros(1, 12, 8, 8)
+    torch.onnx.export(model, example, path, input_names=["board"], output_names=["logits"],
+                      dynamic_axes={"board": {0: "batch"}, "logits": {0: "batch"}}, dynamo=False)
+
+def read_positions(pgn_path, max_positions=None):
+    boards = []
+    with open(pgn_path) as f:
+        while (game := chess.pgn.read_game(f)) is not None:
+            board = game.board()
+            for move in game.mainline_moves():
+                board.push(move)
+                if not board.is_game_over():
+                    boards.append(board.copy(stack=False))
+    return boards[:max_positions]
+
+def compare_models(reference, candidates, boards, batch_size=64):
+    """Top-1 legal move agreement with `reference` and mean latency per batch."""
+    results = {}
+    with torch.no_grad():
+        inputs = [torch.from_numpy(boards_to_tensor(boards[i:i + batch_size]))
+                  for i in range(0, len(boards), batch_size)]
+        masks = [legal_move_mask(boards[i:i + batch_size]) for i in range(0, len(boards), batch_size)]
+        expected = [select_moves(reference(x), boards[i * batch_size:(i + 1) * batch_size], mask)
+                    for i, (x, mask) in enumerate(zip(inputs, masks))]
+        for name, model in candidates.items():
+            agree = 0
+            start = time.perf_counter()
+            for i, (x, mask) in enumerate(zip(inputs, masks)):
+                moves = select_moves(model(x), boards[i * batch_size:(i + 1) * batch_size], mask)
+                agree += sum(a == b for a, b in zip(moves, expected[i]))
+            elapsed = time.perf_counter() - start
+            results[name] = {"agreement": agree / len(boards), "ms_per_batch": elapsed / len(inputs) * 1000}
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a checkpoint to TorchScript, int8 TorchScript and ONNX.")
+    parser.add_argument("checkpoint", nargs="?", default="best_chess_model.pth")
+    parser.add_argument("--output-dir", default=".")
+    parser.add_argument("--positions", default=DEFAULT_POSITIONS, help="PGN file of held-out positions for the parity check")
+    parser.add_argument("--max-positions", type=int, default=None)
+    parser.add_argument("--min-agreement", type=float, default=0.95, help="Fail if the int8 model agrees less often than this")
+    parser.add_argument("--no-onnx", action="store_true")
+    args = parser.parse_args()
+
+    model = load_model(args.checkpoint)
+    name = os.path.splitext(os.path.basename(args.checkpoint))[0]
+    os.makedirs(args.output_dir, exist_ok=True)
+    script_path = os.path.join(args.output_dir, f"{name}.pt")
+    int8_path = os.path.join(args.output_dir, f"{name}_int8.pt")
+    onnx_path = os.path.join(args.output_dir, f"{name}.onnx")
+
+    export_torchscript(model, script_path)
+    export_torchscript(quantize_model(model), int8_path)
+    paths = [args.checkpoint, script_path, int8_path]
+    if not args.no_onnx:
+        export_onnx(model, onnx_path)
+        paths.append(onnx_path)
+    for path in paths:
+        print(f"{path}: {os.path.getsize(path) / 2**20:.1f} MB")
+
+    # Parity and latency of each artifact as the serving code loads it
+    boards = read_positions(args.positions, args.max_positions)
+    candidates = {os.path.basename(path): load_model(path) for path in paths}
+    results = compare_models(model, candidates, boards)
+    for artifact, result in results.items():
+        print(f"{artifact}: top-1 agreement {result['agreement']:.2%} on {len(boards)} positions, "
+              f"{result['ms_per_batch']:.2f} ms per batch of 64")
+    if results[os.path.basename(int8_path)]["agreement"] < args.min_agreement:
+        raise SystemExit(f"int8 model agreement is below {args.min_agreement:.0%}")
@@ -1,12 +1,14 @@
 import torch
-import torch.nn as nn
 import torch.optim as optim
 from load import create_data_loaders
-from model import ChessCNN
+from model import build_model
+from losses import make_criterion
+from augment import random_mirror
+from cpu import autocast_context, prepare_model, prepare_inputs
 import matplotlib.pyplot as plt
 from tqdm.auto import tqdm
 import time
-from torch.cuda.amp import GradScaler, autocast
+from torch.amp import GradScaler
 from google.cloud import storage
 import io
 import threading
@@ -72,15 +74,20 @@ def write_status(bucket_name, blob_name, tqdm_out):
     thread.daemon = True
     thread.start()
 
-def train_model(num_epochs=50, batch_size=1024, learning_rate=0.001, data_file="dataset.txt"):
-    train_loader, test_loader = create_data_loaders(data_file, batch_size=batch_size)
+def train_model(num_epochs=50, batch_size=1024, learning_rate=0.001, data_file="dataset.txt", loss_type="ce", legal_mask=False, mirror_prob=0.5, arch="cnn",
+                precision="auto", compile=False, channels_last=False):
+    """See train.train_model for `precision`, `compile` and `channels_last`."""
+    train_loader, test_loader = create_data_loaders(data_file, batch_size=batch_size, legal_mask=legal_mask)
 
     # Initialize model, loss function, and optimizer
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    model = ChessCNN().to(device)
-    criterion = nn.BCEWithLogitsLoss()
+    model = build_model(arch).to(device)
+    # Checkpoints are saved from `model`; the loop calls the possibly compiled `forward_model`
+    forward_model = prepare_model(model, channels_last=channels_last, compile=compile)
+    # Labels are move indices; "ce" trains a softmax over moves, "bce" the original one-hot loss
+    criterion = make_criterion(loss_type)
     optimizer = optim.Adam(model.parameters(), lr=learning_rate)
-    scheduler = torch.optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='min', factor=0.1, patience=5, verbose=True)
+    scheduler = torch.optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='min', factor=0.1, patience=5)
     train_losses = []
     test_losses = []
 
@@ -88,7 +95,8 @@ def train_model(num_epochs=50, batch_size=1024, learning_rate=0.001, data_file="
     patience = 10
     trigger_times = 0
 
-    scaler = GradScaler()
+    # Loss scaling is only needed for float16
+    scaler = GradScaler(device.type, enabled=device.type == "cuda" and precision == "auto")
 
     # Epochs to save the model (in case program crashes)
     save_epochs = {1, 2, 3, 5, 10, 15, 20, 25}
@@ -107,13 +115,17 @@ def train_model(num_epochs=50, batch_size=1024, learning_rate=0.001, data_file="
         epoch_start_time = time.time()
 
         train_pbar = tqdm(train_loader, desc=f"Epoch {epoch+1}/{num_epochs} [Train]", file=tqdm_out, dynamic_ncols=True)
-        for inputs, labels in train_pbar:
-            inputs, labels = inputs.to(device), labels.to(device)
+        for batch in train_pbar:
+            inputs, labels = batch[0].to(device), batch[1].to(device)
+            mask = batch[2].to(device) if len(batch) > 2 else None
+            # Mirror augmentation on the whole batch, on the device
+            inputs, labels, mask = random_mirror(inputs, labels, mask, p=mirror_prob)
+            inputs = prepare_inputs(inputs, channels_last)
             optimizer.zero_grad()
 
-            with autocast():
-                outputs = model(inputs)
-                loss = criterion(outputs, labels)
+            with autocast_context(device, precision):
+                outputs = forward_model(inputs)
+                loss = criterion(outputs, labels, mask)
 
             scaler.scale(loss).backward()
             scaler.step(optimizer)
@@ -131,10 +143,11 @@ def train_model(num_epochs=50, batch_size=1024, learning_rate=0.001, data_file="
         total_test_loss = 0
         test_pbar = tqdm(test_loader, desc=f"Epoch {epoch+1}/{num_epochs} [Valid]", file=tqdm_out, dynamic_ncols=True)
         with torch.no_grad():
-            for inputs, labels in test_pbar:
-                inputs, labels = inputs.to(device), labels.to(device)
-                outputs = model(inputs)
-                loss = criterion(outputs, labels)
+            for batch in test_pbar:
+                inputs, labels = prepare_inputs(batch[0].to(device), channels_last), batch[1].to(device)
+                mask = batch[2].to(device) if len(batch) > 2 else None
+                outputs = forward_model(inputs)
+                loss = criterion(outputs, labels, mask)
                 total_test_loss += loss.item()
 
                 test_pbar.set_postfix({'loss': f'{loss.item():.4f}'})
@@ -0,0 +1,47 @@
+import torch.nn as nn
+import torch.nn.functional as F
+
+from moves import mask_logits
+
+def make_criterion(loss_type="ce"):
+    """Returns loss(outputs, labels, mask=None) for integer move labels.
+
+    "ce" is categorical cross-entropy over the 4096 moves, restricted to the
+    legal moves when a mask is given. "bce" reproduces the original
+    BCEWithLogitsLoss on one-hot labels, built on the device from the indices.
+    """
+    if loss_type == "ce":
+        criterion = nn.CrossEntropyLoss()
+
+        def loss(outputs, labels, mask=None):
+            if mask is not None:
+                outputs = mask_logits(outputs, mask)
+            return criterion(outputs, labels)
+    elif loss_type == "bce":
+        criterion = nn.BCEWithLogitsLoss()
+
+        def loss(outputs, labels, mask=None):
+            return criterion(outputs, F.one_hot(labels, outputs.shape[1]).to(outputs.dtype))
+    else:
+        raise ValueError(f"Unknown loss type: {loss_type}")
+    return loss
+
+def make_distillation_criterion(loss_type="ce", temperature=2.0, alpha=0.5):
+    """Returns loss(student_outputs, teacher_outputs, labels, mask=None).
+
+    Mixes the hard-label loss of `make_criterion` with the cross-entropy
+    between the temperature-softened teacher and student distributions,
+    scaled by temperature^2 so its gradients keep their size.
+    """
+    hard_loss = make_criterion(loss_type)
+
+    def loss(outputs, teacher_outputs, labels, mask=None):
+        student, teacher = outputs.float(), teacher_outputs.float()
+        if mask is not None:
+            student, teacher = mask_logits(student, mask), mask_logits(teacher, mask)
+        targets = F.softmax(teacher / temperature, dim=1)
+        log_probs = F.log_softmax(student / temperature, dim=1)
+        # Masked moves have zero target probability and -inf log probability
+        soft_loss = -(targets * log_probs.masked_fill(targets == 0, 0)).sum(dim=1).mean()
+        return alpha * soft_loss * temperature ** 2 + (1 - alpha) * hard_loss(outputs, labels, mask)
+    return loss
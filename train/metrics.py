@@ -0,0 +1,119 @@
+import os
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+import torch
+
+PHASES = ("data", "h2d", "compute", "optimizer", "checkpoint")
+
+class StepTimer:
+    """Per-step timings of the training loop over a rolling window of steps.
+
+    Each step is split into waiting for the next batch (`data`), copying it to
+    the device (`h2d`), forward and backward (`compute`), the optimizer step
+    and checkpoint snapshots. Timing costs a few perf_counter calls per step.
+    On CUDA, kernels run asynchronously, so a phase is only charged for its
+    GPU work with `sync=True`, which synchronizes at every phase boundary.
+    """
+
+    def __init__(self, window=200, device=None, sync=False):
+        self.sync = sync and device is not None and device.type == "cuda"
+        self.times = {phase: deque(maxlen=window) for phase in PHASES}
+        self.totals = deque(maxlen=window)
+        self.samples = deque(maxlen=window)
+        self.steps = 0
+        self.profiler = None
+        self._current = dict.fromkeys(PHASES, 0.0)
+        self._step_start = None
+
+    def iter(self, loader):
+        """Yields the loader's batches, timing how long each one took to arrive."""
+        batches = iter(loader)
+        while True:
+            self._step_start = time.perf_counter()
+            try:
+                batch = next(batches)
+            except StopIteration:
+                return
+            self._current["data"] = time.perf_counter() - self._step_start
+            yield batch
+
+    @contextmanager
+    def phase(self, name):
+        label = torch.profiler.record_function(name) if self.profiler else nullcontext()
+        with label:
+            start = time.perf_counter()
+            yield
+            if self.sync:
+                torch.cuda.synchronize()
+            self._current[name] += time.perf_counter() - start
+
+    def end_step(self, batch_size):
+        total = time.perf_counter() - self._step_start
+        for phase in PHASES:
+            self.times[phase].append(self._current[phase])
+            self._current[phase] = 0.0
+        self.totals.append(total)
+        self.samples.append(batch_size)
+        self.steps += 1
+        if self.profiler is not None:
+            self.profiler.step(self.steps)
+
+    def summary(self):
+        """Samples/sec and p50/p90/p99 milliseconds per phase over the window."""
+        if not self.totals:
+            return {}
+        summary = {"samples_per_s": sum(self.samples) / sum(self.totals)}
+        for phase, values in (*self.times.items(), ("step", self.totals)):
+            p50, p90, p99 = np.percentile(np.fromiter(values, dtype=np.float64), (50, 90, 99)) * 1000
+            summary[phase] = {"p50_ms": p50, "p90_ms": p90, "p99_ms": p99}
+        return summary
+
+    def format_summary(self):
+        summary = self.summary()
+        if not summary:
+            return "no steps timed"
+        parts = [f"{summary['samples_per_s']:,.0f} samples/s"]
+        for phase in (*PHASES, "step"):
+            s = summary[phase]
+            parts.append(f"{phase} {s['p50_ms']:.1f}/{s['p90_ms']:.1f}/{s['p99_ms']:.1f}")
+        return ", ".join(parts) + " ms (p50/p90/p99)"
+
+class ProfilerWindow:
+    """Profiles the steps after `start` up to `stop` and writes a Chrome trace.
+
+    Opt in with e.g. train_model(profile_steps=(100, 110)). Outside the window
+    it costs one comparison per step.
+    """
+
+    def __init__(self, start, stop, trace_dir="profiles"):
+        self.start = start
+        self.stop = stop
+        self.trace_dir = trace_dir
+        self._profile = None
+
+    def step(self, step):
+        if step == self.start and self._profile is None:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self._profile = torch.profiler.profile(activities=activities)
+            self._profile.__enter__()
+        elif step == self.stop and self._profile is not None:
+            self._profile.__exit__(None, None, None)
+            os.makedirs(self.trace_dir, exist_ok=True)
+            path = os.path.join(self.trace_dir, f"trace_steps_{self.start}-{self.stop}.json")
+            self._profile.export_chrome_trace(path)
+            print(self._profile.key_averages().table(sort_by="self_cpu_time_total", row_limit=15))
+            print(f"Profiler trace for steps {self.start}-{self.stop} written to {path}")
+            self._profile = None
+
+    def __bool__(self):
+        return self._profile is not None
+
+def parse_steps(value):
+    """Parses "START:STOP" into a (start, stop) tuple of steps."""
+    start, stop = value.split(":")
+    return int(start), int(stop)
@@ -15,19 +15,148 @@ class ChessCNN(nn.Module):
         self.fc2 = nn.Linear(1024, 64 * 64)
         self.dropout = nn.Dropout(0.3)
         
-    def forward(self, x):
+    def features(self, x):
         x = F.relu(self.bn1(self.conv1(x)))
         x = F.relu(self.bn2(self.conv2(x)))
         x = F.relu(self.bn3(self.conv3(x)))
-        x = x.view(-1, 256 * 8 * 8)
+        x = x.reshape(-1, 256 * 8 * 8)  # reshape, so channels-last activations work too
         x = F.relu(self.fc1(x))
         x = self.dropout(x)
-        x = self.fc2(x)
         return x
 
+    def forward(self, x):
+        return self.fc2(self.features(x))
+
+    def forward_legal(self, x, rows, indices):
+        """Logits of selected moves only: `indices[i]` of position `rows[i]`.
+
+        Evaluates just the fc2 rows of moves that occur in the batch (about
+        35 of 4096 for one position) from a gathered weight submatrix. The
+        logits equal the matching entries of forward() up to float rounding.
+        """
+        x = self.features(x)
+        moves, columns = torch.unique(indices, return_inverse=True)
+        logits = torch.addmm(self.fc2.bias[moves], x, self.fc2.weight[moves].t())
+        return logits[rows, columns]
+
+class ConvPolicyCNN(nn.Module):
+    """ChessCNN's convolutional trunk with a fully convolutional policy head.
+
+    The head outputs 64 planes, one per to-square, over the 8x8 from-squares,
+    which is reshaped into the same from * 64 + to logits as ChessCNN (squares
+    in tensor order, row 0 = eighth rank). Its convolutions are dilated so
+    every from-square sees the whole board.
+    """
+
+    def __init__(self, head_channels=64):
+        super(ConvPolicyCNN, self).__init__()
+        self.conv1 = nn.Conv2d(12, 64, kernel_size=3, padding=1)
+        self.bn1 = nn.BatchNorm2d(64)
+        self.conv2 = nn.Conv2d(64, 128, kernel_size=3, padding=1)
+        self.bn2 = nn.BatchNorm2d(128)
+        self.conv3 = nn.Conv2d(128, 256, kernel_size=3, padding=1)
+        self.bn3 = nn.BatchNorm2d(256)
+        self.policy_conv1 = nn.Conv2d(256, head_channels, kernel_size=3, padding=2, dilation=2)
+        self.policy_bn1 = nn.BatchNorm2d(head_channels)
+        self.policy_conv2 = nn.Conv2d(head_channels, head_channels, kernel_size=3, padding=2, dilation=2)
+        self.policy_bn2 = nn.BatchNorm2d(head_channels)
+        self.policy_out = nn.Conv2d(head_channels, 64, kernel_size=1)
+
+    def forward(self, x):
+        x = F.relu(self.bn1(self.conv1(x)))
+        x = F.relu(self.bn2(self.conv2(x)))
+        x = F.relu(self.bn3(self.conv3(x)))
+        x = F.relu(self.policy_bn1(self.policy_conv1(x)))
+        x = F.relu(self.policy_bn2(self.policy_conv2(x)))
+        x = self.policy_out(x)  # (N, to, from_row, from_col)
+        return x.flatten(2).transpose(1, 2).reshape(-1, 64 * 64)
+
+class TinyChessCNN(nn.Module):
+    """A small, fully convolutional student network for distill.py.
+
+    Same input and from * 64 + to output layout as ConvPolicyCNN, sized to
+    answer in well under a millisecond on one core.
+    """
+
+    def __init__(self, channels=32):
+        super(TinyChessCNN, self).__init__()
+        self.conv1 = nn.Conv2d(12, channels, kernel_size=3, padding=1)
+        self.bn1 = nn.BatchNorm2d(channels)
+        self.conv2 = nn.Conv2d(channels, channels, kernel_size=3, padding=2, dilation=2)
+        self.bn2 = nn.BatchNorm2d(channels)
+        self.conv3 = nn.Conv2d(channels, channels, kernel_size=3, padding=4, dilation=4)
+        self.bn3 = nn.BatchNorm2d(channels)
+        self.policy = nn.Conv2d(channels, 64, kernel_size=1)
+
+    def forward(self, x):
+        x = F.relu(self.bn1(self.conv1(x)))
+        x = F.relu(self.bn2(self.conv2(x)))
+        x = F.relu(self.bn3(self.conv3(x)))
+        x = self.policy(x)  # (N, to, from_row, from_col)
+        return x.flatten(2).transpose(1, 2).reshape(-1, 64 * 64)
+
+# Architectures selectable by name, e.g. train_model(arch="conv_policy")
+ARCHITECTURES = {
+    "cnn": ChessCNN,
+    "conv_policy": ConvPolicyCNN,
+    "tiny": TinyChessCNN,
+}
+
+def build_model(arch="cnn"):
+    if arch not in ARCHITECTURES:
+        raise ValueError(f"Unknown architecture {arch!r}, expected one of {sorted(ARCHITECTURES)}")
+    return ARCHITECTURES[arch]()
+
+def detect_arch(state_dict):
+    """Infers the architecture a checkpoint was saved from."""
+    if "policy.weight" in state_dict:
+        return "tiny"
+    return "conv_policy" if "policy_out.weight" in state_dict else "cnn"
+
 # Test the model
 if __name__ == "__main__":
-    model = ChessCNN()
-    sample_input = torch.randn(1, 12, 8, 8)  # Batch size 1, 12 channels, 8x8 board
-    output = model(sample_input)
-    print(f"Output shape: {output.shape}")
\ No newline at end of file
+    import io
+    import time
+
+    def measure(model, batch_size, repeats=50):
+        x = torch.randn(batch_size, 12, 8, 8)
+        with torch.no_grad():
+            for _ in range(5):
+                model(x)
+            start = time.perf_counter()
+            for _ in range(repeats):
+                model(x)
+        return (time.perf_counter() - start) / repeats * 1000
+
+    for arch in ARCHITECTURES:
+        model = build_model(arch).eval()
+        output = model(torch.randn(1, 12, 8, 8))
+        params = sum(p.numel() for p in model.parameters())
+        buffer = io.BytesIO()
+        torch.save(model.state_dict(), buffer)
+        start = time.perf_counter()
+        buffer.seek(0)
+        build_model(arch).load_state_dict(torch.load(buffer))
+        load_time = (time.perf_counter() - start) * 1000
+        print(f"{arch}: output {tuple(output.shape)}, {params:,} parameters "
+              f"({params * 4 / 2**20:.1f} MB of weights), checkpoint {buffer.getbuffer().nbytes / 2**20:.1f} MB, load {load_time:.1f} ms")
+        for batch_size in (1, 64):
+            print(f"  batch {batch_size:3d}: {measure(model, batch_size):7.2f} ms per forward pass")
+
+    # Final layer: every fc2 row against the rows of ~35 moves per position
+    model = ChessCNN().eval()
+    model.features = lambda x: x  # Time fc2 alone
+    for batch_size in (1, 64):
+        x = torch.randn(batch_size, 1024)
+        rows = torch.arange(batch_size).repeat_interleave(35)
+        indices = torch.randint(0, 64 * 64, (len(rows),))
+        with torch.no_grad():
+            difference = (model.fc2(x)[rows, indices] - model.forward_legal(x, rows, indices)).abs().max()
+            timings = []
+            for fn in (lambda: model.fc2(x), lambda: model.forward_legal(x, rows, indices)):
+                start = time.perf_counter()
+                for _ in range(50):
+                    fn()
+                timings.append((time.perf_counter() - start) / 50 * 1000)
+        print(f"fc2 batch {batch_size:3d}: full {timings[0]:.3f} ms, legal-only {timings[1]:.3f} ms, "
+              f"max difference {difference.item():.1e}")
@@ -0,0 +1,119 @@
+import numpy as np
+import torch
+import chess
+
+# The policy head scores moves by from * 64 + to, with squares in the dataset's
+# FEN order (a8 = 0, see preprocessing/get_moves.py). That is chess.square_mirror
+# of a python-chess square (a1 = 0), i.e. the square XOR 56.
+POLICY_SIZE = 64 * 64
+
+# Precomputed tables, indexed by policy index; squares in FEN order
+INDEX_FROM = np.arange(POLICY_SIZE, dtype=np.int64) // 64
+INDEX_TO = np.arange(POLICY_SIZE, dtype=np.int64) % 64
+# Moves that land on the first or last rank; for pawns these are promotions
+INDEX_PROMOTES = np.isin(INDEX_TO // 8, (0, 7))
+
+def move_index(move):
+    """Policy index of a python-chess move."""
+    return chess.square_mirror(move.from_square) * 64 + chess.square_mirror(move.to_square)
+
+def legal_move_indices(boards):
+    """Returns (rows, indices) of every legal move, flattened over the batch."""
+    counts = np.empty(len(boards), dtype=np.int64)
+    indices = []
+    for i, board in enumerate(boards):
+        before = len(indices)
+        # move_index, inlined: square_mirror is XOR 56
+        indices.extend((move.from_square ^ 56) * 64 + (move.to_square ^ 56) for move in board.legal_moves)
+        counts[i] = len(indices) - before
+    rows = np.repeat(np.arange(len(boards)), counts)
+    return rows, np.asarray(indices, dtype=np.int64)
+
+def legal_move_mask(boards, out=None):
+    """Boolean (N, 4096) tensor marking the legal moves of each board."""
+    if out is None:
+        out = torch.zeros((len(boards), POLICY_SIZE), dtype=torch.bool)
+    else:
+        out.zero_()
+    rows, indices = legal_move_indices(boards)
+    out[torch.from_numpy(rows), torch.from_numpy(indices)] = True
+    return out
+
+def mask_logits(logits, mask):
+    return logits.masked_fill(~mask, float('-inf'))
+
+def decode_moves(indices, boards):
+    """Turns policy indices back into moves.
+
+    The policy cannot tell promotion pieces apart, so pawn moves onto the last
+    rank are decoded as queen promotions.
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    # Back from FEN order to python-chess squares
+    from_squares = INDEX_FROM[indices] ^ 56
+    to_squares = INDEX_TO[indices] ^ 56
+    pawns = np.array([board.pawns for board in boards], dtype=np.uint64)
+    is_pawn = ((pawns >> from_squares.astype(np.uint64)) & np.uint64(1)).astype(bool)
+    promotes = is_pawn & INDEX_PROMOTES[indices]
+    return [chess.Move(int(f), int(t), promotion=chess.QUEEN if p else None)
+            for f, t, p in zip(from_squares, to_squares, promotes)]
+
+def decode_best(indices, has_move, boards):
+    """decode_moves, with None for the boards that have no legal move."""
+    moves = decode_moves(indices, boards)
+    return [move if legal else None for move, legal in zip(moves, has_move.tolist())]
+
+def select_moves(logits, boards, mask=None):
+    """Masked argmax: the highest scoring legal move of each board.
+
+    A board without legal moves (checkmate or stalemate) gets None. Pawn
+    moves onto the last rank always decode as queen promotions.
+    """
+    if mask is None:
+        mask = legal_move_mask(boards)
+    best = mask_logits(logits, mask).argmax(dim=1)
+    return decode_best(best.numpy(), mask.any(dim=1), boards)
+
+def top_k_moves(logits, boards, k=3, mask=None):
+    """The k highest scoring legal moves of each board, best first."""
+    if mask is None:
+        mask = legal_move_mask(boards)
+    k = min(k, POLICY_SIZE)
+    scores, indices = mask_logits(logits, mask).topk(k, dim=1)
+    valid = torch.isfinite(scores).numpy()
+    indices = indices.numpy()
+    moves = []
+    for row, board in enumerate(boards):
+        row_indices = indices[row][valid[row]]
+        moves.append(decode_moves(row_indices, [board] * len(row_indices)))
+    return moves
+
+def sample_moves(logits, boards, temperature=1.0, mask=None, generator=None):
+    """Samples one legal move per board from softmax(logits / temperature); None without legal moves."""
+    if mask is None:
+        mask = legal_move_mask(boards)
+    if temperature <= 0:
+        return select_moves(logits, boards, mask)
+    has_move = mask.any(dim=1)
+    probs = torch.softmax(mask_logits(logits.float() / temperature, mask), dim=1)
+    probs[~has_move] = 1.0  # All -inf rows are NaN; sample anything and discard it
+    chosen = torch.multinomial(probs, 1, generator=generator).squeeze(1)
+    return decode_best(chosen.numpy(), has_move, boards)
+
+def dataset_legal_mask(board, label):
+    """Legal-move mask for a training sample, in the dataset's label convention.
+
+    Dataset labels index squares in FEN order (a8 = 0, see
+    preprocessing/get_moves.py), which is chess.square_mirror of python-chess
+    squares. The dataset does not record castling rights, so castling is
+    allowed wherever king and rook are on their home squares. The `label`
+    itself is always marked legal so the loss stays finite.
+    """
+    board = board.copy(stack=False)
+    board.castling_rights = chess.BB_CORNERS
+    board.castling_rights = board.clean_castling_rights()
+    mask = torch.zeros(POLICY_SIZE, dtype=torch.bool)
+    indices = [move_index(move) for move in board.legal_moves]
+    mask[indices] = True
+    mask[label] = True
+    return mask
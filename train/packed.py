@@ -0,0 +1,160 @@
+import sys
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+import chess
+
+from encode import board_bitboards, bitboards_to_tensor, bitboards_to_board
+from moves import dataset_legal_mask
+
+# Fixed-width record: 12 piece bitboards, side to move (1 = white) and from * 64 + to
+RECORD_DTYPE = np.dtype([('bitboards', '<u8', (12,)), ('turn', 'u1'), ('move', '<u2')])
+MAGIC = b"CHESSBB1"
+HEADER_SIZE = len(MAGIC)
+
+# Mirroring a position flips the ranks (a byte swap of each bitboard) and swaps the colours
+MIRROR_CHANNELS = np.r_[6:12, 0:6]
+
+def parse_line(line):
+    """Parses a `fen color from to` line of the text format, or returns None."""
+    parts = line.strip().split()
+    if len(parts) < 4:
+        return None
+    fen = ' '.join(parts[:-3])  # FEN might contain spaces
+    return fen, parts[-3], int(parts[-2]), int(parts[-1])
+
+def iter_record_chunks(text_file, chunk_size=65536):
+    """Parses the text dataset format into arrays of packed records, one chunk at a time."""
+    records = np.zeros(chunk_size, dtype=RECORD_DTYPE)
+    boards = []
+    with open(text_file, 'r') as f:
+        for line in f:
+            parsed = parse_line(line)
+            if parsed is None:
+                print(f"Skipping invalid line: {line.strip()}")
+                continue
+            fen, color, moved_from, moved_to = parsed
+            i = len(boards)
+            boards.append(chess.BaseBoard(fen.split()[0]))
+            records['turn'][i] = color == 'w'
+            records['move'][i] = moved_from * 64 + moved_to
+            if len(boards) == chunk_size:
+                board_bitboards(boards, out=records['bitboards'])
+                yield records
+                boards = []
+    if boards:
+        board_bitboards(boards, out=records['bitboards'][:len(boards)])
+        yield records[:len(boards)]
+
+def read_records(text_file, chunk_size=65536):
+    """Reads a whole text dataset into one packed record array."""
+    chunks = [chunk.copy() for chunk in iter_record_chunks(text_file, chunk_size)]
+    return np.concatenate(chunks) if chunks else np.zeros(0, dtype=RECORD_DTYPE)
+
+def convert(text_file, packed_file, chunk_size=65536):
+    """Converts the text dataset format into packed binary records."""
+    count = 0
+    with open(packed_file, 'wb') as out:
+        out.write(MAGIC)
+        for chunk in iter_record_chunks(text_file, chunk_size):
+            chunk.tofile(out)
+            count += len(chunk)
+    return count
+
+def mirror_records(bitboards, turn, move):
+    """Mirrors packed records: ranks flipped, colours swapped and the move's squares mirrored."""
+    bitboards = bitboards[..., MIRROR_CHANNELS].byteswap()
+    move = move.astype(np.int64)
+    move = (move // 64 ^ 56) * 64 + (move % 64 ^ 56)
+    return bitboards, 1 - turn, move
+
+class RecordDataset(Dataset):
+    """Map-style dataset over an array of packed records in `self.data`.
+
+    With `augment`, the dataset also serves each position mirrored, computed
+    on the fly rather than stored; trainers normally mirror whole batches
+    instead.
+    """
+
+    def __init__(self, augment=False, legal_mask=False):
+        self.augment = augment
+        self.legal_mask = legal_mask
+
+    def __len__(self):
+        return self.num_records * 2 if self.augment else self.num_records
+
+    def __getitem__(self, idx):
+        record = self.data[idx % self.num_records]
+        bitboards = record['bitboards'][None]
+        turn = int(record['turn'])
+        move_index = int(record['move'])
+        if idx >= self.num_records:
+            bitboards, turn, move = mirror_records(bitboards, turn, np.array([move_index]))
+            move_index = int(move[0])
+        input_tensor = torch.from_numpy(bitboards_to_tensor(bitboards)[0])
+        output_label = torch.tensor(move_index, dtype=torch.long)
+
+        if self.legal_mask:
+            board = bitboards_to_board(bitboards[0], turn)
+            return input_tensor, output_label, dataset_legal_mask(board, move_index)
+        return input_tensor, output_label
+
+    def __getitems__(self, indices):
+        """Whole-batch version of __getitem__: one gather from the records, one decode."""
+        indices = np.asarray(indices, dtype=np.int64)
+        records = self.data[indices % self.num_records]
+        bitboards = records['bitboards']
+        turn = records['turn'].astype(np.int64)
+        moves = records['move'].astype(np.int64)
+        if self.augment:
+            mirrored = indices >= self.num_records
+            if mirrored.any():
+                bitboards[mirrored], turn[mirrored], moves[mirrored] = mirror_records(
+                    bitboards[mirrored], turn[mirrored], moves[mirrored])
+        inputs = torch.from_numpy(bitboards_to_tensor(bitboards))
+        labels = torch.from_numpy(moves)
+
+        if self.legal_mask:
+            masks = torch.stack([dataset_legal_mask(bitboards_to_board(b, t), m)
+                                 for b, t, m in zip(bitboards, turn, moves)])
+            return inputs, labels, masks
+        return inputs, labels
+
+class PackedChessDataset(RecordDataset):
+    """Dataset over a memory-mapped packed file.
+
+    The file is mapped lazily in each process, so DataLoader workers share
+    the OS page cache instead of copying the data.
+    """
+
+    def __init__(self, filename, augment=False, legal_mask=False):
+        super().__init__(augment=augment, legal_mask=legal_mask)
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            if f.read(HEADER_SIZE) != MAGIC:
+                raise ValueError(f"{filename} is not a packed chess dataset.")
+        self.num_records = self._records().shape[0]
+        if self.num_records == 0:
+            raise ValueError("No valid data found in the file.")
+        self._data = None
+
+    def _records(self):
+        return np.memmap(self.filename, dtype=RECORD_DTYPE, mode='r', offset=HEADER_SIZE)
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = self._records()
+        return self._data
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_data'] = None  # Each worker maps the file itself
+        return state
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python packed.py <dataset.txt> <dataset.bin>")
+        sys.exit(1)
+    count = convert(sys.argv[1], sys.argv[2])
+    print(f"Wrote {count} records to {sys.argv[2]}")
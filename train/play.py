@@ -1,28 +1,71 @@
 import chess
 import torch
-import numpy as np
-from model import ChessCNN
-from load import fen_to_tensor
+import torch.nn as nn
+from model import build_model, detect_arch
+from encode import boards_to_tensor
+from moves import select_moves, decode_best, legal_move_indices
+from checkpoint import load_checkpoint
+
+class OnnxModel:
+    """Runs an exported ONNX model with onnxruntime, called like the torch model."""
+
+    def __init__(self, model_path):
+        import onnxruntime  # Only needed to serve .onnx files
+        self.session = onnxruntime.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+
+    def __call__(self, input_tensor):
+        (output,) = self.session.run(None, {"board": input_tensor.numpy()})
+        return torch.from_numpy(output)
 
 def load_model(model_path):
-    model = ChessCNN()
-    model.load_state_dict(torch.load(model_path, map_location=torch.device('cpu')))
+    """Loads a checkpoint (.pth), a training state (.ckpt) or an artifact written by export.py (.pt, .onnx)."""
+    if model_path.endswith('.onnx'):
+        return OnnxModel(model_path)
+    if model_path.endswith('.pt'):
+        return torch.jit.load(model_path, map_location=torch.device('cpu'))
+    if model_path.endswith('.ckpt'):
+        state_dict = load_checkpoint(model_path)["model"]
+    else:
+        state_dict = torch.load(model_path, map_location=torch.device('cpu'))
+    model = build_model(detect_arch(state_dict))
+    model.load_state_dict(state_dict)
     model.eval()
     return model
 
 def get_ai_move(model, board):
-    input_tensor = fen_to_tensor(board.fen())
-    input_tensor = torch.from_numpy(input_tensor).float().unsqueeze(0)
-    
+    return get_ai_moves(model, [board])[0]
+
+def get_ai_moves(model, boards):
+    """Batched get_ai_move: one forward pass and one masked argmax for all boards."""
+    input_tensor = torch.from_numpy(boards_to_tensor(boards))
+    output = policy_logits(model, input_tensor, boards)
+    return decode_policy(model, output, boards)
+
+def scores_legal_only(model):
+    return isinstance(getattr(model, 'fc2', None), nn.Linear)
+
+def policy_logits(model, input_tensor, boards, legal=None):
+    """Move logits of the encoded boards; illegal moves are -inf when scored legal-only.
+
+    `legal` is the (rows, indices) of legal_move_indices(boards), if already computed.
+    """
     with torch.no_grad():
-        output = model(input_tensor)
-    
-    move_probs = output.squeeze().numpy()
-    legal_moves = list(board.legal_moves)
-    legal_move_indices = [move.from_square * 64 + move.to_square for move in legal_moves]
-    legal_move_probs = move_probs[legal_move_indices]
-    best_move_index = np.argmax(legal_move_probs)
-    return legal_moves[best_move_index]
+        if not scores_legal_only(model):
+            return model(input_tensor)
+
+        # Only score the legal moves; same moves as the full forward pass
+        rows, indices = legal if legal is not None else legal_move_indices(boards)
+        rows, indices = torch.from_numpy(rows), torch.from_numpy(indices)
+        scores = model.forward_legal(input_tensor, rows, indices)
+    output = torch.full((len(boards), 64 * 64), float('-inf'))
+    output[rows, indices] = scores
+    return output
+
+def decode_policy(model, output, boards, mask=None):
+    """Best legal move of each board; `mask` is legal_move_mask(boards), if already computed."""
+    if scores_legal_only(model):
+        return decode_best(output.argmax(dim=1).numpy(), torch.isfinite(output).any(dim=1), boards)
+    return select_moves(output, boards, mask)
 
 def play_game():
     model = load_model("best_chess_model.pth")
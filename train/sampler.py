@@ -0,0 +1,132 @@
+import numpy as np
+import torch
+from torch.utils.data import Dataset, Sampler
+
+class RandomBatchSampler(Sampler):
+    """Yields whole batches of indices as numpy arrays.
+
+    Used with a dataset that implements `__getitems__`, so each batch is
+    gathered, decoded and labelled in one call instead of one call per sample.
+    With `world_size` > 1, each rank takes every world_size-th index of the
+    same (seeded) order, so the ranks see disjoint shards.
+    """
+
+    def __init__(self, num_samples, batch_size, shuffle=True, drop_last=False, seed=None, rank=0, world_size=1):
+        if shuffle and world_size > 1 and seed is None:
+            raise ValueError("Sharding a shuffled order across ranks needs a seed shared by all of them.")
+        self.num_samples = num_samples
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.seed = seed  # With a seed, each epoch's order is reproducible (see set_epoch)
+        self.rank = rank
+        self.world_size = world_size
+        self.epoch = 0
+        self.skip_batches = 0
+
+    def set_epoch(self, epoch, skip_batches=0):
+        """Selects the order of `epoch` and skips the batches already trained on."""
+        self.epoch = epoch
+        self.skip_batches = skip_batches
+
+    def _order(self):
+        if not self.shuffle:
+            order = np.arange(self.num_samples)
+        else:
+            generator = None
+            if self.seed is not None:
+                generator = torch.Generator().manual_seed(self.seed + self.epoch)
+            order = torch.randperm(self.num_samples, generator=generator).numpy()
+        return order[self.rank::self.world_size]
+
+    def _shard_size(self):
+        return len(range(self.rank, self.num_samples, self.world_size))
+
+    def __iter__(self):
+        order = self._order()
+        for start in range(self.skip_batches * self.batch_size, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            if self.drop_last and len(batch) < self.batch_size:
+                break
+            yield batch
+
+    def __len__(self):
+        if self.drop_last:
+            return self._shard_size() // self.batch_size
+        return -(-self._shard_size() // self.batch_size)
+
+class IndexedDataset(Dataset):
+    """A view of `dataset` through an index array, like Subset but batch-aware.
+
+    The indices are kept as one int64 array rather than a Python list, and
+    whole batches are remapped with a single gather.
+    """
+
+    def __init__(self, dataset, indices):
+        self.dataset = dataset
+        self.indices = np.asarray(indices, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, idx):
+        return self.dataset[int(self.indices[idx])]
+
+    def __getitems__(self, batch):
+        return self.dataset.__getitems__(self.indices[np.asarray(batch, dtype=np.int64)])
+
+def random_split_indices(num_samples, train_split=0.8, generator=None):
+    """Shuffled train/test index arrays, the array equivalent of random_split."""
+    order = torch.randperm(num_samples, generator=generator).numpy()
+    train_size = int(train_split * num_samples)
+    return order[:train_size], order[train_size:]
+
+def collate_batch(batch):
+    """`__getitems__` already returns collated tensors."""
+    return batch
+
+if __name__ == "__main__":
+    import sys
+    import time
+    from torch.utils.data import DataLoader
+    from load import ChessDataset
+
+    class PerSampleDataset(Dataset):
+        """Hides `__getitems__`, so the DataLoader goes through `__getitem__` as before."""
+        def __init__(self, dataset):
+            self.dataset = dataset
+        def __len__(self):
+            return len(self.dataset)
+        def __getitem__(self, idx):
+            return self.dataset[idx]
+
+    if len(sys.argv) < 2:
+        print("Usage: python sampler.py <dataset.txt | dataset.bin> [batch_size] [num_batches]")
+        sys.exit(1)
+    filename = sys.argv[1]
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 1024
+    num_batches = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+
+    if filename.endswith('.bin'):
+        from packed import PackedChessDataset
+        dataset = PackedChessDataset(filename)
+    else:
+        dataset = ChessDataset(filename)
+
+    def measure(loader):
+        start = time.perf_counter()
+        count = 0
+        while count < num_batches:
+            for _ in loader:
+                count += 1
+                if count == num_batches:
+                    break
+        return num_batches / (time.perf_counter() - start)
+
+    for num_workers in (0, 2, 4):
+        per_sample = DataLoader(PerSampleDataset(dataset), batch_size=batch_size, shuffle=True,
+                                num_workers=num_workers)
+        batched = DataLoader(dataset, batch_sampler=RandomBatchSampler(len(dataset), batch_size),
+                             collate_fn=collate_batch, num_workers=num_workers)
+        print(f"num_workers={num_workers}: per-sample {measure(per_sample):8.2f} batches/s, "
+              f"batched {measure(batched):8.2f} batches/s")
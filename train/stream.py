@@ -1,7 +1,12 @@
+import os
+import random
 import numpy as np
 import torch
-from torch.utils.data import IterableDataset, DataLoader
+from torch.utils.data import IterableDataset, DataLoader, get_worker_info
 import chess
+from encode import board_bitboards, bitboards_to_tensor, bitboards_to_board
+from packed import parse_line, mirror_records
+from moves import dataset_legal_mask
 
 # Constants
 BOARD_SIZE = 8
@@ -34,69 +39,163 @@ def fen_to_tensor(fen):
     
     return tensor
 
-def augment_data(fen, moved_from, moved_to):
-    board = chess.Board(fen)
-    augmented_data = [(fen, moved_from, moved_to)]
-    
-    # Mirror horizontally
-    mirrored_board = board.mirror()
-    mirrored_fen = mirrored_board.fen()
-    mirrored_from = chess.square_mirror(moved_from)
-    mirrored_to = chess.square_mirror(moved_to)
-    augmented_data.append((mirrored_fen, mirrored_from, mirrored_to))
-    
-    return augmented_data
+def shard_range(start, end, shard, num_shards):
+    """Splits the byte range [start, end) into `num_shards` contiguous pieces."""
+    size = end - start
+    return start + size * shard // num_shards, start + size * (shard + 1) // num_shards
+
+def iter_lines(filename, start, end):
+    """Yields the lines of `filename` that start inside the byte range [start, end)."""
+    with open(filename, 'rb') as f:
+        if start > 0:
+            # Skip the line that started before our range; it belongs to the previous shard
+            f.seek(start - 1)
+            f.readline()
+        pos = f.tell()
+        while pos < end:
+            line = f.readline()
+            if not line:
+                break
+            pos += len(line)
+            yield line.decode()
+
+def shuffle_buffer(items, buffer_size, rng):
+    """Approximate shuffle holding at most `buffer_size` items in memory."""
+    buffer = []
+    for item in items:
+        if len(buffer) < buffer_size:
+            buffer.append(item)
+            continue
+        i = rng.randrange(buffer_size)
+        yield buffer[i]
+        buffer[i] = item
+    rng.shuffle(buffer)
+    yield from buffer
 
 class StreamingChessDataset(IterableDataset):
-    def __init__(self, filename):
+    """Streams samples from the byte range [start, end) of a text dataset.
+
+    The range is split into one shard per DataLoader worker and per
+    distributed rank, so every line is read exactly once per epoch. Samples
+    pass through a bounded shuffle buffer seeded by (seed, epoch, shard). If
+    `batch_size` is set, the dataset yields whole batches (use the DataLoader
+    with batch_size=None), and `set_epoch(epoch, skip_batches)` resumes an
+    epoch part way through.
+    """
+
+    def __init__(self, filename, start=0, end=None, batch_size=None, buffer_size=0, seed=0,
+                 rank=0, world_size=1, legal_mask=False, augment=False):
         self.filename = filename
+        self.start = start
+        self.end = os.path.getsize(filename) if end is None else end
+        self.batch_size = batch_size
+        self.buffer_size = buffer_size
+        self.seed = seed
+        self.rank = rank
+        self.world_size = world_size
+        self.legal_mask = legal_mask
+        self.augment = augment  # Mirrored copies per line; trainers normally mirror whole batches instead
+        self.epoch = 0
+        self.skip_batches = 0
+
+    def set_epoch(self, epoch, skip_batches=0):
+        """Selects the shuffle order of `epoch` and skips the batches already trained on.
+
+        Takes effect for workers started afterwards, so use non-persistent workers.
+        """
+        self.epoch = epoch
+        self.skip_batches = skip_batches
+
+    def _samples(self, start, end):
+        """(board, turn, move, mirrored) per sample; boards are only encoded once batched."""
+        for line in iter_lines(self.filename, start, end):
+            parsed = parse_line(line)
+            if parsed is None:
+                continue
+            fen, color, moved_from, moved_to = parsed
+            board = chess.BaseBoard(fen.split()[0])
+            sample = (board, color == 'w', moved_from * 64 + moved_to)
+            yield sample + (False,)
+            if self.augment:
+                yield sample + (True,)
+
+    def _encode(self, samples):
+        """Encodes a list of samples like RecordDataset.__getitems__: one bitboard pass, one unpack."""
+        boards, turn, moves, mirrored = zip(*samples)
+        bitboards = board_bitboards(boards)
+        turn = np.array(turn, dtype=np.int64)
+        moves = np.array(moves, dtype=np.int64)
+        mirrored = np.array(mirrored)
+        if mirrored.any():
+            bitboards[mirrored], turn[mirrored], moves[mirrored] = mirror_records(
+                bitboards[mirrored], turn[mirrored], moves[mirrored])
+        inputs = torch.from_numpy(bitboards_to_tensor(bitboards))
+        # Labels are move indices; losses expand them on the device if needed
+        labels = torch.from_numpy(moves)
+
+        if self.legal_mask:
+            masks = torch.stack([dataset_legal_mask(bitboards_to_board(b, t), m)
+                                 for b, t, m in zip(bitboards, turn, moves)])
+            return inputs, labels, masks
+        return inputs, labels
 
     def __iter__(self):
-        with open(self.filename, 'r') as f:
-            for line in f:
-                parts = line.strip().split()
-                if len(parts) >= 4:
-                    fen = ' '.join(parts[:-3])  # FEN might contain spaces
-                    color = parts[-3]
-                    moved_from = int(parts[-2])
-                    moved_to = int(parts[-1])
-                    # Augment data
-                    augmented_data = augment_data(fen, moved_from, moved_to)
-                    for aug_fen, aug_from, aug_to in augmented_data:
-                        input_tensor = torch.tensor(fen_to_tensor(aug_fen), dtype=torch.float32)
-                        
-                        # Create output label (one-hot encoding for the move)
-                        output_label = torch.zeros(64 * 64, dtype=torch.float32)
-                        move_index = aug_from * 64 + aug_to
-                        output_label[move_index] = 1
-                        
-                        yield input_tensor, output_label
-
-def create_data_loaders(filename, batch_size=32, train_split=0.8):
-    dataset = StreamingChessDataset(filename)
-    
-    # Determine the total number of samples
-    total_samples = sum(1 for _ in open(filename)) * 2  # *2 because of data augmentation
-    
-    train_size = int(train_split * total_samples)
-    test_size = total_samples - train_size
-    
-    train_dataset = torch.utils.data.Subset(dataset, range(train_size))
-    test_dataset = torch.utils.data.Subset(dataset, range(train_size, total_samples))
-    
-    train_loader = DataLoader(train_dataset, batch_size=batch_size, num_workers=4)
-    test_loader = DataLoader(test_dataset, batch_size=batch_size, num_workers=4)
-    
+        worker_info = get_worker_info()
+        num_workers = worker_info.num_workers if worker_info else 1
+        # The DataLoader takes batches from its workers round-robin starting at
+        # worker 0, so on resume worker 0 takes the role of whichever worker
+        # produced the next batch
+        worker_id = ((worker_info.id if worker_info else 0) + self.skip_batches) % num_workers
+        shard = self.rank * num_workers + worker_id
+        num_shards = self.world_size * num_workers
+
+        start, end = shard_range(self.start, self.end, shard, num_shards)
+        samples = self._samples(start, end)
+        if self.buffer_size > 1:
+            rng = random.Random(f"{self.seed}-{self.epoch}-{shard}")
+            samples = shuffle_buffer(samples, self.buffer_size, rng)
+
+        if self.batch_size is None:
+            for sample in samples:
+                yield tuple(tensor[0] for tensor in self._encode([sample]))
+            return
+
+        # This worker produced every num_workers-th of the batches already seen
+        skip = max(0, -(-(self.skip_batches - worker_id) // num_workers))
+        batch = []
+        for sample in samples:
+            batch.append(sample)
+            if len(batch) == self.batch_size:
+                if skip:
+                    skip -= 1
+                else:
+                    yield self._encode(batch)
+                batch = []
+        if batch and not skip:
+            yield self._encode(batch)
+
+def create_data_loaders(filename, batch_size=32, train_split=0.8, num_workers=4, buffer_size=10000,
+                        seed=0, rank=0, world_size=1, legal_mask=False):
+    # Hold out the tail of the file by bytes, so nothing has to be counted
+    size = os.path.getsize(filename)
+    split = int(train_split * size)
+
+    train_dataset = StreamingChessDataset(filename, 0, split, batch_size=batch_size, buffer_size=buffer_size,
+                                          seed=seed, rank=rank, world_size=world_size, legal_mask=legal_mask)
+    test_dataset = StreamingChessDataset(filename, split, size, batch_size=batch_size,
+                                         rank=rank, world_size=world_size, legal_mask=legal_mask)
+
+    train_loader = DataLoader(train_dataset, batch_size=None, num_workers=num_workers)
+    test_loader = DataLoader(test_dataset, batch_size=None, num_workers=num_workers)
+
     return train_loader, test_loader
 
 if __name__ == "__main__":
     filename = "dataset.txt"
     train_loader, test_loader = create_data_loaders(filename)
-    print(f"Number of training batches: {len(train_loader)}")
-    print(f"Number of testing batches: {len(test_loader)}")
 
     # Example of accessing a batch
     for inputs, labels in train_loader:
         print(f"Input shape: {inputs.shape}")
         print(f"Label shape: {labels.shape}")
-        break
\ No newline at end of file
+        break
@@ -1,23 +1,118 @@
 import torch
-import torch.nn as nn
 import torch.optim as optim
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel
 from load import create_data_loaders
-from model import ChessCNN
+from stream import create_data_loaders as create_streaming_loaders
+from model import build_model
+from losses import make_criterion, make_distillation_criterion
+from augment import random_mirror
+from checkpoint import CheckpointWriter, snapshot, restore, set_rng_state, latest_checkpoint, load_checkpoint, to_cpu
+from metrics import StepTimer, ProfilerWindow, parse_steps
+from cpu import configure_threads, autocast_context, prepare_model, prepare_inputs, PRECISIONS
+from validate import AsyncValidator, format_result, validation_indices, epoch_checkpoints
 import matplotlib.pyplot as plt
 from tqdm import tqdm
+import os
 import time
-from torch.cuda.amp import GradScaler, autocast
+import argparse
+import signal
+import threading
+from contextlib import nullcontext
+from torch.amp import GradScaler
 
-def train_model(num_epochs=50, batch_size=1024, learning_rate=0.001, data_file="dataset.txt"):
-    train_loader, test_loader = create_data_loaders(data_file, batch_size=batch_size)
+def all_reduce_sum(*values):
+    totals = torch.tensor(values, dtype=torch.float64)
+    dist.all_reduce(totals)
+    return totals.tolist()
 
-    # Initialize model, loss function, and optimizer
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    model = ChessCNN().to(device)
-    criterion = nn.BCEWithLogitsLoss()
+def train_model(num_epochs=50, batch_size=1024, learning_rate=0.001, data_file="dataset.txt", loss_type="ce", legal_mask=False, mirror_prob=0.5, arch="cnn",
+                checkpoint_dir="checkpoints", checkpoint_every=1000, keep_checkpoints=3, resume=None, seed=0,
+                log_every=100, profile_steps=None, profile_dir="profiles",
+                precision="auto", compile=False, channels_last=False, threads=None, interop_threads=None,
+                async_validation=False, validation_samples=10000, validation_threads=1,
+                teacher=None, temperature=2.0, alpha=0.5, model_name="chess_model", plot_path="loss_plot.png",
+                streaming=False, num_workers=0, rank=0, world_size=1):
+    """Trains a model, checkpointing the full training state to `checkpoint_dir`.
+
+    A checkpoint is written every `checkpoint_every` batches (0 disables the
+    mid-epoch ones), at the end of each epoch, and on SIGTERM. `resume` is a
+    checkpoint path, or "latest" for the newest one in `checkpoint_dir`;
+    training then continues from the batch where that checkpoint was taken.
+
+    Every `log_every` steps, samples/sec and rolling p50/p90/p99 times of
+    the data wait, host-to-device copy, compute and optimizer phases are
+    logged. `profile_steps=(start, stop)` traces those steps with
+    torch.profiler into `profile_dir`.
+
+    `precision` is "auto" (float16 autocast on CUDA, float32 on the CPU),
+    "fp32" or "bf16" (bfloat16 autocast, for CPUs with bf16 support).
+    `compile` runs the model through torch.compile, `channels_last` switches
+    convolutions to NHWC, and `threads`/`interop_threads` size the thread
+    pools; see cpu.py for a benchmark of these options.
+
+    With `async_validation`, the epochs do not stop for the test loader:
+    a separate process (validate.py, `validation_threads` threads) scores
+    each end-of-epoch checkpoint on `validation_samples` test positions,
+    with top-1/top-3 legal-move accuracy, and saves the best model. Its
+    loss drives the scheduler and early stopping once it arrives, usually
+    a few batches into the next epoch.
+
+    With a `teacher` model, the loop distills it into the new model: the
+    loss mixes the labels with the teacher's softened policy (see
+    make_distillation_criterion), while validation stays on the labels.
+    The best model is saved as best_{model_name}.pth.
+
+    `streaming` reads a text dataset through stream.py instead of loading
+    it, with `num_workers` DataLoader workers.
+
+    With `world_size` > 1 this is one rank of a DistributedDataParallel job
+    on CPU, in a process group already set up (see distributed.py).
+    `batch_size` is then the global batch, split evenly across the ranks,
+    and each rank reads its own shard of the data. Losses are averaged over
+    all ranks, so the scheduler and early stopping agree; only rank 0
+    writes checkpoints and models. SIGTERM handling and async validation
+    are single-process only.
+    """
+    if world_size > 1 and async_validation:
+        raise ValueError("Async validation is not supported with world_size > 1.")
+    if streaming and async_validation:
+        raise ValueError("Async validation needs the map-style dataset's test split, not streaming.")
+    configure_threads(threads, interop_threads)
+    local_batch_size = max(1, batch_size // world_size)
+    if streaming:
+        train_loader, test_loader = create_streaming_loaders(data_file, batch_size=local_batch_size, num_workers=num_workers,
+                                                             seed=seed, rank=rank, world_size=world_size, legal_mask=legal_mask)
+    else:
+        train_loader, test_loader = create_data_loaders(data_file, batch_size=local_batch_size, legal_mask=legal_mask,
+                                                        num_workers=num_workers, seed=seed, rank=rank, world_size=world_size)
+
+    # Initialize model, loss function, and optimizer; distributed runs train on the CPU over gloo
+    device = torch.device("cuda" if torch.cuda.is_available() and world_size == 1 else "cpu")
+    if world_size > 1:
+        # DDP copies rank 0's initial weights to every rank; mirroring differs per rank
+        torch.manual_seed(seed + rank)
+    model = build_model(arch).to(device)
+    # Checkpoints are saved from `model`; the loop calls the possibly compiled (and DDP-wrapped) `forward_model`
+    ddp_model = None
+    if world_size > 1:
+        # Convert before DDP registers the parameters; backward() then averages the gradients across ranks
+        prepare_model(model, channels_last=channels_last)
+        ddp_model = DistributedDataParallel(model)
+        forward_model = prepare_model(ddp_model, compile=compile)
+    else:
+        forward_model = prepare_model(model, channels_last=channels_last, compile=compile)
+    # DDP would synchronize buffers on every forward, which uneven test shards cannot match
+    test_model = forward_model if ddp_model is None else model
+    # Labels are move indices; "ce" trains a softmax over moves, "bce" the original one-hot loss
+    test_criterion = make_criterion(loss_type)
+    criterion = test_criterion
+    if teacher is not None:
+        teacher = teacher.to(device).eval()
+        criterion = make_distillation_criterion(loss_type, temperature=temperature, alpha=alpha)
     optimizer = optim.Adam(model.parameters(), lr=learning_rate)
 
-    scheduler = torch.optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='min', factor=0.1, patience=5, verbose=True)
+    scheduler = torch.optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='min', factor=0.1, patience=5)
 
     train_losses = []
     test_losses = []
@@ -26,79 +121,233 @@ def train_model(num_epochs=50, batch_size=1024, learning_rate=0.001, data_file="
     patience = 10
     trigger_times = 0
 
-    scaler = GradScaler()
+    # Loss scaling is only needed for float16
+    scaler = GradScaler(device.type, enabled=device.type == "cuda" and precision == "auto")
 
     # Epochs to save the model
     save_epochs = {1, 2, 3, 5, 10, 15, 20, 25}
 
+    start_epoch, start_step, total_train_loss, resume_rng = 0, 0, 0, None
+    if resume == "latest":
+        resume = latest_checkpoint(checkpoint_dir)
+    if resume:
+        state = load_checkpoint(resume)
+        progress = restore(state, model, optimizer, scheduler, scaler)
+        start_epoch, start_step = state["epoch"], state["step"]
+        train_losses, test_losses = progress["train_losses"], progress["test_losses"]
+        best_test_loss, trigger_times = progress["best_test_loss"], progress["trigger_times"]
+        total_train_loss, resume_rng = progress["total_train_loss"], state["rng"]
+        if rank == 0:
+            print(f"Resumed from {resume} at epoch {start_epoch + 1}, batch {start_step}")
+
+    # Checkpoints are snapshotted in the loop and written in the background, by rank 0 only
+    writer = CheckpointWriter(checkpoint_dir, keep_last=keep_checkpoints) if rank == 0 else None
+
+    def checkpoint(epoch, step, is_best=False, keep=False):
+        if writer is None:
+            return
+        state = snapshot(model, optimizer, scheduler, scaler, epoch, step,
+                         train_losses=list(train_losses), test_losses=list(test_losses),
+                         best_test_loss=best_test_loss, trigger_times=trigger_times,
+                         total_train_loss=total_train_loss)
+        writer.save_checkpoint(state, is_best=is_best, keep=keep)
+
+    def apply_validation(results):
+        """Feeds validation results to the scheduler and early stopping; True when training should stop."""
+        nonlocal best_test_loss, trigger_times
+        for result in results:
+            tqdm.write(format_result(result))
+            writer.release(os.path.join(checkpoint_dir, result["checkpoint"]))
+            if "error" in result:
+                continue
+            test_losses.append(result["loss"])
+            scheduler.step(result["loss"])
+            if result["loss"] < best_test_loss:
+                best_test_loss = result["loss"]
+                trigger_times = 0
+                if result.get("best"):
+                    tqdm.write("New best model saved!")
+            else:
+                trigger_times += 1
+        return trigger_times >= patience
+
+    validator = None
+    if async_validation:
+        # Epoch checkpoints are kept until validated, including those left unvalidated by a resumed run
+        for _, path in epoch_checkpoints(checkpoint_dir, len(test_losses)):
+            writer.keep(path)
+        # The validator only loads its subsample of the test split
+        indices = validation_indices(test_loader.dataset.indices, validation_samples, seed)
+        validator = AsyncValidator(checkpoint_dir, data_file, loss_type=loss_type, legal_mask=legal_mask,
+                                   batch_size=batch_size, indices=indices, after_epoch=len(test_losses), best_loss=best_test_loss, save_best=f"best_{model_name}.pth",
+                                   precision="bf16" if precision == "bf16" else "fp32", threads=validation_threads)
+
+    timer = StepTimer(device=device)
+    if profile_steps:
+        timer.profiler = ProfilerWindow(*profile_steps, trace_dir=profile_dir)
+
+    # On preemption, finish the current batch, checkpoint and exit
+    preempted = threading.Event()
+    handle_sigterm = world_size == 1 and threading.current_thread() is threading.main_thread()
+    if handle_sigterm:
+        previous_handler = signal.signal(signal.SIGTERM, lambda signum, frame: preempted.set())
+
     # Training
-    for epoch in range(num_epochs):
-        model.train()
-        total_train_loss = 0
-        epoch_start_time = time.time()
-
-        train_pbar = tqdm(train_loader, desc=f"Epoch {epoch+1}/{num_epochs} [Train]")
-        for inputs, labels in train_pbar:
-            inputs, labels = inputs.to(device), labels.to(device)
-            optimizer.zero_grad()
-
-            with autocast():
-                outputs = model(inputs)
-                loss = criterion(outputs, labels)
-
-            scaler.scale(loss).backward()
-            scaler.step(optimizer)
-            scaler.update()
-
-            total_train_loss += loss.item()
-
-            train_pbar.set_postfix({'loss': f'{loss.item():.4f}'})
-
-        avg_train_loss = total_train_loss / len(train_loader)
-        train_losses.append(avg_train_loss)
-
-        # Validation
-        model.eval()
-        total_test_loss = 0
-        test_pbar = tqdm(test_loader, desc=f"Epoch {epoch+1}/{num_epochs} [Valid]")
-        with torch.no_grad():
-            for inputs, labels in test_pbar:
-                inputs, labels = inputs.to(device), labels.to(device)
-                outputs = model(inputs)
-                loss = criterion(outputs, labels)
-                total_test_loss += loss.item()
-
-                test_pbar.set_postfix({'loss': f'{loss.item():.4f}'})
-
-        avg_test_loss = total_test_loss / len(test_loader)
-        test_losses.append(avg_test_loss)
-
-        scheduler.step(avg_test_loss)
-
-        # Check for early stopping
-        if avg_test_loss < best_test_loss:
-            best_test_loss = avg_test_loss
-            trigger_times = 0
-            torch.save(model.state_dict(), "best_chess_model.pth")
-            print("New best model saved!")
-        else:
-            trigger_times += 1
-            if trigger_times >= patience:
+    try:
+        stop_early = False
+        for epoch in range(start_epoch, num_epochs):
+            model.train()
+            skip = start_step if epoch == start_epoch else 0
+            if skip == 0:
+                total_train_loss = 0
+            train_batches = skip
+            (train_loader.dataset if streaming else train_loader.batch_sampler).set_epoch(epoch, skip_batches=skip)
+            epoch_start_time = time.time()
+
+            batches = iter(train_loader)
+            if resume_rng is not None:
+                # Same random state (e.g. for mirroring) as when the checkpoint was taken
+                set_rng_state(resume_rng)
+                resume_rng = None
+
+            train_pbar = tqdm(batches, desc=f"Epoch {epoch+1}/{num_epochs} [Train]", initial=skip,
+                              total=None if streaming else len(train_loader), disable=rank != 0)
+            # Shards can differ by a batch; join() lets ranks that run out keep the others' all-reduces going
+            with ddp_model.join() if ddp_model is not None else nullcontext():
+                for step, batch in enumerate(timer.iter(train_pbar), start=skip + 1):
+                    with timer.phase("h2d"):
+                        inputs, labels = batch[0].to(device), batch[1].to(device)
+                        mask = batch[2].to(device) if len(batch) > 2 else None
+                    with timer.phase("compute"):
+                        # Mirror augmentation on the whole batch, on the device
+                        inputs, labels, mask = random_mirror(inputs, labels, mask, p=mirror_prob)
+                        inputs = prepare_inputs(inputs, channels_last)
+                        optimizer.zero_grad()
+
+                        with autocast_context(device, precision):
+                            outputs = forward_model(inputs)
+                            if teacher is not None:
+                                with torch.no_grad():
+                                    teacher_outputs = teacher(inputs)
+                                loss = criterion(outputs, teacher_outputs, labels, mask)
+                            else:
+                                loss = criterion(outputs, labels, mask)
+
+                        scaler.scale(loss).backward()
+                    with timer.phase("optimizer"):
+                        scaler.step(optimizer)
+                        scaler.update()
+
+                    total_train_loss += loss.item()
+                    train_batches = step
+
+                    train_pbar.set_postfix({'loss': f'{loss.item():.4f}'})
+
+                    if preempted.is_set():
+                        checkpoint(epoch, step)
+                        writer.close()
+                        if validator is not None:
+                            validator.close(wait=False)
+                        print(f"Stopped at epoch {epoch + 1}, batch {step}; resume with --resume latest")
+                        return
+                    if checkpoint_every and step % checkpoint_every == 0:
+                        with timer.phase("checkpoint"):
+                            checkpoint(epoch, step)
+                    timer.end_step(labels.size(0))
+                    if rank == 0 and log_every and timer.steps % log_every == 0:
+                        tqdm.write(f"Step {step}: {timer.format_summary()}")
+                    if validator is not None and apply_validation(validator.poll()):
+                        stop_early = True
+                        break
+
+            if stop_early:
                 print("Early stopping triggered.")
                 break
 
-        # Save the model at specified epochs
-        if (epoch + 1) in save_epochs:
-            torch.save(model.state_dict(), f"chess_model_epoch_{epoch + 1}.pth")
-            print(f"Model saved at epoch {epoch + 1}.")
+            if world_size > 1:
+                total_train_loss, train_batches = all_reduce_sum(total_train_loss, train_batches)
+            avg_train_loss = total_train_loss / train_batches
+            train_losses.append(avg_train_loss)
+
+            if validator is not None:
+                # The validator picks this checkpoint up; its result is applied when it arrives
+                checkpoint(epoch + 1, 0, keep=True)
+            else:
+                # Validation
+                model.eval()
+                total_test_loss, test_batches = 0, 0
+                test_pbar = tqdm(test_loader, desc=f"Epoch {epoch+1}/{num_epochs} [Valid]", disable=rank != 0)
+                with torch.no_grad():
+                    for batch in test_pbar:
+                        inputs, labels = prepare_inputs(batch[0].to(device), channels_last), batch[1].to(device)
+                        mask = batch[2].to(device) if len(batch) > 2 else None
+                        outputs = test_model(inputs)
+                        loss = test_criterion(outputs, labels, mask)
+                        total_test_loss += loss.item()
+                        test_batches += 1
 
-        epoch_end_time = time.time()
-        epoch_duration = epoch_end_time - epoch_start_time
+                        test_pbar.set_postfix({'loss': f'{loss.item():.4f}'})
 
-        print(f"Epoch [{epoch+1}/{num_epochs}], "
-              f"Train Loss: {avg_train_loss:.4f}, "
-              f"Test Loss: {avg_test_loss:.4f}, "
-              f"Time: {epoch_duration:.2f}s")
+                if world_size > 1:
+                    # Every rank sees the same averages, so the scheduler and early stopping agree
+                    total_test_loss, test_batches = all_reduce_sum(total_test_loss, test_batches)
+                avg_test_loss = total_test_loss / test_batches
+                test_losses.append(avg_test_loss)
+
+                scheduler.step(avg_test_loss)
+
+                # Check for early stopping
+                is_best = avg_test_loss < best_test_loss
+                if is_best:
+                    best_test_loss = avg_test_loss
+                    trigger_times = 0
+                    if writer is not None:
+                        writer.write(to_cpu(model.state_dict()), f"best_{model_name}.pth")
+                        print("New best model saved!")
+                else:
+                    trigger_times += 1
+
+                # End-of-epoch checkpoint: resuming from it starts the next epoch
+                checkpoint(epoch + 1, 0, is_best=is_best)
+                if trigger_times >= patience:
+                    if rank == 0:
+                        print("Early stopping triggered.")
+                    break
+
+            # Save the model at specified epochs
+            if writer is not None and (epoch + 1) in save_epochs:
+                writer.write(to_cpu(model.state_dict()), f"{model_name}_epoch_{epoch + 1}.pth")
+                print(f"Model saved at epoch {epoch + 1}.")
+
+            epoch_end_time = time.time()
+            epoch_duration = epoch_end_time - epoch_start_time
+
+            if rank != 0:
+                continue
+            if validator is not None:
+                print(f"Epoch [{epoch+1}/{num_epochs}], "
+                      f"Train Loss: {avg_train_loss:.4f}, "
+                      f"Validated epochs: {len(test_losses)}, "
+                      f"Time: {epoch_duration:.2f}s")
+            else:
+                print(f"Epoch [{epoch+1}/{num_epochs}], "
+                      f"Train Loss: {avg_train_loss:.4f}, "
+                      f"Test Loss: {avg_test_loss:.4f}, "
+                      f"Time: {epoch_duration:.2f}s" + (f", Ranks: {world_size}" if world_size > 1 else ""))
+            print(f"Last {len(timer.totals)} steps: {timer.format_summary()}")
+    finally:
+        if handle_sigterm:
+            signal.signal(signal.SIGTERM, previous_handler)
+
+    if writer is None:
+        return
+    if validator is not None:
+        # Record the epochs still being validated (and their best model) before plotting;
+        # the last checkpoint must be on disk for the validator to find it
+        writer.flush()
+        apply_validation(validator.close())
+    # Also prunes the checkpoints the validator released
+    writer.close()
 
     # Plot loss
     plt.figure(figsize=(10, 5))
@@ -108,8 +357,41 @@ def train_model(num_epochs=50, batch_size=1024, learning_rate=0.001, data_file="
     plt.ylabel('Loss')
     plt.title('Training and Validation Loss')
     plt.legend()
-    plt.savefig('loss_plot.png')
+    plt.savefig(plot_path)
     plt.close()
 
 if __name__ == "__main__":
-    train_model()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Train the move prediction model.")
+    parser.add_argument("--data-file", default="dataset.txt")
+    parser.add_argument("--epochs", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=1024)
+    parser.add_argument("--arch", default="cnn")
+    parser.add_argument("--checkpoint-dir", default="checkpoints")
+    parser.add_argument("--checkpoint-every", type=int, default=1000, help="Batches between mid-epoch checkpoints (0 = epoch ends only)")
+    parser.add_argument("--keep-checkpoints", type=int, default=3)
+    parser.add_argument("--log-every", type=int, default=100, help="Steps between throughput summaries (0 = epoch ends only)")
+    parser.add_argument("--profile-steps", type=parse_steps, default=None, help="START:STOP steps to trace with torch.profiler")
+    parser.add_argument("--precision", choices=PRECISIONS, default="auto", help="bf16 enables bfloat16 autocast (CPU or CUDA)")
+    parser.add_argument("--compile", action="store_true", help="Run the model through torch.compile")
+    parser.add_argument("--channels-last", action="store_true")
+    parser.add_argument("--threads", type=int, default=None, help="Intra-op threads (default: torch's choice)")
+    parser.add_argument("--interop-threads", type=int, default=None)
+    parser.add_argument("--async-validation", action="store_true",
+                        help="Validate end-of-epoch checkpoints in a separate process instead of between epochs")
+    parser.add_argument("--validation-samples", type=int, default=10000)
+    parser.add_argument("--validation-threads", type=int, default=1)
+    parser.add_argument("--streaming", action="store_true", help="Stream the text file instead of loading it into memory")
+    parser.add_argument("--num-workers", type=int, default=0)
+    parser.add_argument("--resume", nargs="?", const="latest", default=None,
+                        help="Checkpoint to resume from (default: the latest in --checkpoint-dir)")
+    args = parser.parse_args()
+
+    train_model(num_epochs=args.epochs, batch_size=args.batch_size, data_file=args.data_file, arch=args.arch,
+                checkpoint_dir=args.checkpoint_dir, checkpoint_every=args.checkpoint_every,
+                keep_checkpoints=args.keep_checkpoints, resume=args.resume,
+                log_every=args.log_every, profile_steps=args.profile_steps,
+                precision=args.precision, compile=args.compile, channels_last=args.channels_last,
+                threads=args.threads, interop_threads=args.interop_threads,
+                async_validation=args.async_validation, validation_samples=args.validation_samples,
+                validation_threads=args.validation_threads,
+                streaming=args.streaming, num_workers=args.num_workers)
\ No newline at end of file
@@ -0,0 +1,239 @@
+import argparse
+import json
+import os
+import queue
+import shutil
+import time
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from torch.utils.data import DataLoader
+
+from packed import RecordDataset, PackedChessDataset, iter_record_chunks
+from model import build_model, detect_arch
+from losses import make_criterion
+from moves import mask_logits
+from sampler import RandomBatchSampler, collate_batch, random_split_indices
+from checkpoint import CHECKPOINT_PATTERN, BEST_CHECKPOINT, list_checkpoints, load_checkpoint, save_atomic
+from cpu import autocast_context
+
+RESULTS_FILE = "validation.jsonl"
+
+class RecordSubset(RecordDataset):
+    """Only the records at `indices` of a dataset file, so the rest is never held in memory.
+
+    A packed file is gathered from its memory map, a text file in one
+    streaming pass.
+    """
+
+    def __init__(self, data_file, indices, legal_mask=True):
+        super().__init__(legal_mask=legal_mask)
+        indices = np.sort(np.asarray(indices, dtype=np.int64))
+        if data_file.endswith('.bin'):
+            self.data = np.array(PackedChessDataset(data_file).data[indices])
+        else:
+            parts, offset = [], 0
+            for chunk in iter_record_chunks(data_file):
+                selected = indices[(indices >= offset) & (indices < offset + len(chunk))]
+                parts.append(chunk[selected - offset].copy())
+                offset += len(chunk)
+            self.data = np.concatenate(parts)
+        self.num_records = len(self.data)
+
+def test_split_indices(data_file, seed=0, train_split=0.8):
+    """The test split create_data_loaders makes with `seed`, counted without loading the dataset."""
+    if data_file.endswith('.bin'):
+        num_records = PackedChessDataset(data_file).num_records
+    else:
+        num_records = sum(len(chunk) for chunk in iter_record_chunks(data_file))
+    _, test_indices = random_split_indices(num_records, train_split, torch.Generator().manual_seed(seed))
+    return test_indices
+
+def validation_indices(test_indices, num_samples=10000, seed=0):
+    """Record indices of a fixed subsample of the test split, so the validator never
+    scores positions the trainer learns from."""
+    generator = torch.Generator().manual_seed(seed)
+    picked = torch.randperm(len(test_indices), generator=generator)[:num_samples].numpy()
+    return np.sort(np.asarray(test_indices)[picked])
+
+def validation_loader(data_file, num_samples=10000, batch_size=1024, seed=0, indices=None):
+    """The fixed test subsample, with legal-move masks.
+
+    `indices` are the records to use, as validation_indices returns them;
+    without them, the split is recomputed from the file and `seed`.
+    """
+    if indices is None:
+        indices = validation_indices(test_split_indices(data_file, seed), num_samples, seed)
+    subset = RecordSubset(data_file, indices)
+    sampler = RandomBatchSampler(len(subset), batch_size, shuffle=False)
+    return DataLoader(subset, batch_sampler=sampler, collate_fn=collate_batch)
+
+def evaluate(model, loader, criterion, legal_mask=False, precision="fp32", device=torch.device("cpu")):
+    """Loss, plus top-1 and top-3 accuracy among the legal moves.
+
+    The loss is masked only when training is (`legal_mask`), so it matches
+    the trainer's own test loss; the accuracies are always over legal moves.
+    """
+    model.eval()
+    total_loss, top1, top3, total = 0.0, 0, 0, 0
+    with torch.no_grad():
+        for inputs, labels, mask in loader:
+            inputs, labels, mask = inputs.to(device), labels.to(device), mask.to(device)
+            with autocast_context(device, precision):
+                outputs = model(inputs)
+            outputs = outputs.float()
+            total_loss += criterion(outputs, labels, mask if legal_mask else None).item() * labels.size(0)
+            # The label is always marked legal, so it is never one of the -inf picks
+            best = mask_logits(outputs, mask).topk(3, dim=1).indices
+            hits = best == labels.unsqueeze(1)
+            top1 += hits[:, 0].sum().item()
+            top3 += hits.any(dim=1).sum().item()
+            total += labels.size(0)
+    return {"loss": total_loss / total, "top1": top1 / total, "top3": top3 / total, "samples": total}
+
+def epoch_checkpoints(directory, after_epoch=0):
+    """End-of-epoch checkpoints (step 0) of epochs after `after_epoch`, as (epoch, path), oldest first."""
+    found = []
+    for path in list_checkpoints(directory):
+        match = CHECKPOINT_PATTERN.search(path)
+        epoch, step = int(match.group(1)), int(match.group(2))
+        if step == 0 and epoch > after_epoch:
+            found.append((epoch, path))
+    return found
+
+def watch(checkpoint_dir="checkpoints", data_file="dataset.txt", results=None, stop=None, loss_type="ce",
+          legal_mask=False, num_samples=10000, batch_size=1024, seed=0, indices=None, after_epoch=0,
+          best_loss=float('inf'), save_best=None, precision="fp32", threads=1, poll_interval=1.0):
+    """Validates each end-of-epoch checkpoint as it appears in `checkpoint_dir`.
+
+    Results are appended to validation.jsonl and, when `results` is a queue,
+    sent back to the trainer. With `save_best` (a path such as
+    best_chess_model.pth), a checkpoint whose loss beats `best_loss` has its
+    weights saved there and is copied to best.ckpt. Setting `stop`
+    makes the watcher validate whatever is left and return. A checkpoint
+    that cannot be read is reported with an "error" result.
+    """
+    torch.set_num_threads(threads)
+    loader = validation_loader(data_file, num_samples=num_samples, batch_size=batch_size, seed=seed, indices=indices)
+    criterion = make_criterion(loss_type)
+    models = {}
+
+    def report(result):
+        with open(os.path.join(checkpoint_dir, RESULTS_FILE), "a") as f:
+            f.write(json.dumps(result) + "\n")
+        if results is not None:
+            results.put(result)
+        else:
+            print(format_result(result))
+
+    while True:
+        stopping = stop is not None and stop.is_set()
+        # Load every new checkpoint right away; unless the trainer keeps them, the writer may prune them
+        pending = []
+        for epoch, path in epoch_checkpoints(checkpoint_dir, after_epoch):
+            try:
+                pending.append((epoch, path, load_checkpoint(path)["model"]))
+            except Exception as e:
+                report({"epoch": epoch, "checkpoint": os.path.basename(path), "error": f"could not be read: {e}"})
+            after_epoch = epoch
+
+        for epoch, path, state_dict in pending:
+            start = time.time()
+            arch = detect_arch(state_dict)
+            if arch not in models:
+                models[arch] = build_model(arch)
+            model = models[arch]
+            model.load_state_dict(state_dict)
+            result = {"epoch": epoch, "checkpoint": os.path.basename(path),
+                      **evaluate(model, loader, criterion, legal_mask=legal_mask, precision=precision),
+                      "seconds": time.time() - start}
+
+            if save_best and result["loss"] < best_loss:
+                best_loss = result["loss"]
+                save_atomic(state_dict, save_best)
+                best_path = os.path.join(checkpoint_dir, BEST_CHECKPOINT)
+                try:
+                    shutil.copyfile(path, f"{best_path}.tmp")
+                    os.replace(f"{best_path}.tmp", best_path)
+                except FileNotFoundError:
+                    pass  # Pruned since it was loaded; `save_best` still has the weights
+                result["best"] = True
+            report(result)
+
+        if stopping:
+            return
+        if stop is not None:
+            stop.wait(poll_interval)
+        else:
+            time.sleep(poll_interval)
+
+def format_result(result):
+    if "error" in result:
+        return f"Epoch {result['epoch']} was not validated: {result['checkpoint']} {result['error']}"
+    return (f"Epoch {result['epoch']} validation: loss {result['loss']:.4f}, "
+            f"top-1 {result['top1']:.2%}, top-3 {result['top3']:.2%} "
+            f"({result['samples']} positions, {result['seconds']:.1f}s)")
+
+class AsyncValidator:
+    """Runs `watch` in a separate process and collects its results.
+
+    The trainer only polls a queue, so validation never stops training;
+    give the process its own cores with `threads`.
+    """
+
+    def __init__(self, checkpoint_dir, data_file, **kwargs):
+        context = mp.get_context("spawn")
+        self._results = context.Queue()
+        self._stop = context.Event()
+        self._process = context.Process(target=watch, args=(checkpoint_dir, data_file, self._results, self._stop),
+                                        kwargs=kwargs, daemon=True)
+        self._process.start()
+
+    def poll(self):
+        """Results that arrived since the last call, oldest first."""
+        found = []
+        while True:
+            try:
+                found.append(self._results.get_nowait())
+            except queue.Empty:
+                return found
+
+    def close(self, wait=True):
+        """Waits for the checkpoints already written to be validated and returns their results.
+
+        With `wait=False` (e.g. on preemption) the process is stopped at once.
+        """
+        if not wait:
+            self._process.terminate()
+            self._process.join()
+            return []
+        self._stop.set()
+        found = []
+        # Drain while waiting: a child blocked on a full pipe would never exit
+        while self._process.is_alive() or not self._results.empty():
+            try:
+                found.append(self._results.get(timeout=0.1))
+            except queue.Empty:
+                pass
+        self._process.join()
+        if self._process.exitcode != 0:
+            raise RuntimeError(f"Validation process exited with code {self._process.exitcode}")
+        return found
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validate end-of-epoch checkpoints as a training run writes them.")
+    parser.add_argument("--checkpoint-dir", default="checkpoints")
+    parser.add_argument("--data-file", default="dataset.txt")
+    parser.add_argument("--loss-type", default="ce")
+    parser.add_argument("--legal-mask", action="store_true", help="Mask the loss, as when training with legal_mask")
+    parser.add_argument("--samples", type=int, default=10000, help="Size of the fixed test subsample")
+    parser.add_argument("--batch-size", type=int, default=1024)
+    parser.add_argument("--seed", type=int, default=0, help="The training run's seed, which fixes the test split")
+    parser.add_argument("--precision", choices=("fp32", "bf16"), default="fp32")
+    parser.add_argument("--threads", type=int, default=1)
+    args = parser.parse_args()
+
+    watch(args.checkpoint_dir, args.data_file, loss_type=args.loss_type, legal_mask=args.legal_mask,
+          num_samples=args.samples, batch_size=args.batch_size, seed=args.seed,
+          precision=args.precision, threads=args.threads)